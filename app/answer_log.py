@@ -0,0 +1,391 @@
+"""
+Answer-event log for analytics.
+
+Every graded answer becomes an `AnswerEvent` (question id, topic, type,
+correctness and the per-item results of drag-and-drop questions). The
+request path only puts the event on a bounded in-memory queue; a background
+thread writes queued events in batches to SQLite or a JSONL file. When the
+writer falls behind and the queue is full, new events are dropped and
+counted rather than slowing requests down. Pending events are written on
+`stop()`, which runs at interpreter exit.
+
+Per-question accuracy is read back with `accuracy()` (and per-item results
+of one question with `item_stats()`), or over HTTP on /api/quiz/stats.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Iterator
+
+from .grader import ITEM_CORRECT, GradeResult
+from .llm_integration import normalize_topic
+from .metrics import ANSWER_EVENTS_TOTAL, ANSWER_LOG_WRITE_SECONDS
+from .question_models import AnyQuizQuestionModel
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+ANSWER_LOG_PATH = os.getenv("QUIZ_ANSWER_LOG_PATH", "quiz_answer_events.sqlite3")  # *.jsonl for a JSONL file, "" disables
+ANSWER_LOG_QUEUE_SIZE = int(os.getenv("QUIZ_ANSWER_LOG_QUEUE_SIZE", "10000"))  # Events buffered before new ones are dropped
+ANSWER_LOG_BATCH_SIZE = int(os.getenv("QUIZ_ANSWER_LOG_BATCH_SIZE", "200"))  # Events per write
+ANSWER_LOG_FLUSH_INTERVAL = float(os.getenv("QUIZ_ANSWER_LOG_FLUSH_INTERVAL", "1.0"))  # Max seconds an event waits for its batch
+
+
+@dataclass(frozen=True)
+class AnswerEvent:
+    recorded_at: float
+    question_id: str
+    topic: str
+    question_type: str
+    is_correct: bool
+    num_correct: int
+    num_total: int
+    selected_answer: str | None = None  # MCQ
+    items: tuple[dict, ...] = ()        # DAD: {"item", "status", "placed_on", "expected"} per item
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["items"] = list(self.items)
+        return data
+
+
+def answer_event(question: AnyQuizQuestionModel, result: GradeResult) -> AnswerEvent:
+    """The event for one graded answer."""
+    return AnswerEvent(
+        recorded_at=time.time(),
+        question_id=result.question_id,
+        topic=question.topic,
+        question_type=result.question_type,
+        is_correct=result.is_correct,
+        num_correct=result.num_correct,
+        num_total=result.num_total,
+        selected_answer=result.selected_answer,
+        items=tuple(asdict(item) for item in result.items),
+    )
+
+
+# --- Writers ---
+
+class AnswerEventWriter:
+    """Storage for answer events. Only the log's writer thread calls `write`."""
+
+    def write(self, events: list[AnswerEvent]) -> None:
+        raise NotImplementedError
+
+    def iter_events(self, topic: str | None = None, question_id: str | None = None) -> Iterator[dict]:
+        """Stored events as dicts (see AnswerEvent.to_dict), optionally filtered."""
+        raise NotImplementedError
+
+    def accuracy(self, topic: str | None = None, question_id: str | None = None, limit: int = 100) -> list[dict]:
+        """
+        Per-question accuracy, most answered questions first.
+
+        Returns:
+            One dict per question: question_id, topic, question_type,
+            answers, correct, accuracy (share of fully correct answers) and
+            item_accuracy (share of correctly placed DAD items, or of correct
+            MCQ answers), plus last_answered_at.
+        """
+        by_question: dict[str, dict] = {}
+        for event in self.iter_events(topic, question_id):
+            entry = by_question.setdefault(event["question_id"], {
+                "question_id": event["question_id"], "topic": event["topic"],
+                "question_type": event["question_type"], "answers": 0, "correct": 0,
+                "items_correct": 0, "items_total": 0, "last_answered_at": 0.0,
+            })
+            entry["answers"] += 1
+            entry["correct"] += int(event["is_correct"])
+            entry["items_correct"] += event["num_correct"]
+            entry["items_total"] += event["num_total"]
+            entry["last_answered_at"] = max(entry["last_answered_at"], event["recorded_at"])
+        ranked = sorted(by_question.values(), key=lambda entry: (-entry["answers"], entry["question_id"]))
+        return [_with_rates(entry) for entry in ranked[:limit]]
+
+    def item_stats(self, question_id: str) -> list[dict]:
+        """For a DAD question: per item, how often it was answered and placed correctly."""
+        by_item: dict[str, dict] = {}
+        for event in self.iter_events(question_id=question_id):
+            for item in event["items"]:
+                entry = by_item.setdefault(item["item"], {"item": item["item"], "answers": 0, "correct": 0})
+                entry["answers"] += 1
+                entry["correct"] += int(item["status"] == ITEM_CORRECT)
+        return [dict(entry, accuracy=entry["correct"] / entry["answers"]) for entry in by_item.values()]
+
+    def close(self) -> None:
+        pass
+
+
+def _with_rates(entry: dict) -> dict:
+    items_correct, items_total = entry.pop("items_correct"), entry.pop("items_total")
+    entry["accuracy"] = entry["correct"] / entry["answers"] if entry["answers"] else 0.0
+    entry["item_accuracy"] = items_correct / items_total if items_total else 0.0
+    return entry
+
+
+class SQLiteAnswerEventWriter(AnswerEventWriter):
+    """One row per event; accuracy is aggregated in SQL."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS answer_events ("
+            " id INTEGER PRIMARY KEY, recorded_at REAL NOT NULL, question_id TEXT NOT NULL,"
+            " topic TEXT NOT NULL, topic_key TEXT NOT NULL, question_type TEXT NOT NULL,"
+            " is_correct INTEGER NOT NULL, num_correct INTEGER NOT NULL, num_total INTEGER NOT NULL,"
+            " selected_answer TEXT, items TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_answer_events_question ON answer_events (question_id);"
+            "CREATE INDEX IF NOT EXISTS idx_answer_events_topic ON answer_events (topic_key, question_id);"
+        )
+        self._conn.commit()
+
+    def write(self, events: list[AnswerEvent]) -> None:
+        rows = [(e.recorded_at, e.question_id, e.topic, normalize_topic(e.topic), e.question_type,
+                 int(e.is_correct), e.num_correct, e.num_total, e.selected_answer, json.dumps(list(e.items)))
+                for e in events]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO answer_events (recorded_at, question_id, topic, topic_key, question_type,"
+                " is_correct, num_correct, num_total, selected_answer, items) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()  # One transaction per batch
+
+    @staticmethod
+    def _where(topic: str | None, question_id: str | None) -> tuple[str, list]:
+        clauses, params = [], []
+        if topic:
+            clauses.append("topic_key = ?")
+            params.append(normalize_topic(topic))
+        if question_id:
+            clauses.append("question_id = ?")
+            params.append(question_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def iter_events(self, topic: str | None = None, question_id: str | None = None) -> Iterator[dict]:
+        where, params = self._where(topic, question_id)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT recorded_at, question_id, topic, question_type, is_correct, num_correct, num_total,"
+                f" selected_answer, items FROM answer_events{where} ORDER BY id", params,
+            ).fetchall()
+        for row in rows:
+            yield {"recorded_at": row[0], "question_id": row[1], "topic": row[2], "question_type": row[3],
+                   "is_correct": bool(row[4]), "num_correct": row[5], "num_total": row[6],
+                   "selected_answer": row[7], "items": json.loads(row[8])}
+
+    def accuracy(self, topic: str | None = None, question_id: str | None = None, limit: int = 100) -> list[dict]:
+        where, params = self._where(topic, question_id)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question_id, MIN(topic), MIN(question_type), COUNT(*), SUM(is_correct),"
+                f" SUM(num_correct), SUM(num_total), MAX(recorded_at) FROM answer_events{where}"
+                " GROUP BY question_id ORDER BY COUNT(*) DESC, question_id LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [_with_rates({"question_id": row[0], "topic": row[1], "question_type": row[2], "answers": row[3],
+                             "correct": row[4], "items_correct": row[5], "items_total": row[6],
+                             "last_answered_at": row[7]})
+                for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JSONLAnswerEventWriter(AnswerEventWriter):
+    """One JSON line per event. Queries scan the whole file, so this suits development and exports."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._handle = open(path, "a", encoding="utf-8")
+
+    def write(self, events: list[AnswerEvent]) -> None:
+        with self._lock:
+            self._handle.write("".join(json.dumps(event.to_dict()) + "\n" for event in events))
+            self._handle.flush()
+
+    def iter_events(self, topic: str | None = None, question_id: str | None = None) -> Iterator[dict]:
+        topic_key = normalize_topic(topic) if topic else None
+        with self._lock:
+            self._handle.flush()
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn last line from a crash
+                if topic_key and normalize_topic(event["topic"]) != topic_key:
+                    continue
+                if question_id and event["question_id"] != question_id:
+                    continue
+                yield event
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+# --- Log ---
+
+_STOP = object()
+
+
+class AnswerEventLog:
+    """
+    Queues answer events and writes them in batches on a background thread.
+
+    `record` never blocks: when `queue_size` events are already waiting, the
+    event is dropped and counted. The writer thread starts on first use and
+    writes a batch once `batch_size` events are queued or the oldest queued
+    event has waited `flush_interval` seconds. A failed write is logged and
+    its batch is lost; the log keeps going. With no `writer`, events are
+    ignored.
+    """
+
+    def __init__(self,
+                 writer: AnswerEventWriter | None,
+                 queue_size: int = ANSWER_LOG_QUEUE_SIZE,
+                 batch_size: int = ANSWER_LOG_BATCH_SIZE,
+                 flush_interval: float = ANSWER_LOG_FLUSH_INTERVAL):
+        self.writer = writer
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._counts = {"queued": 0, "dropped": 0, "written": 0, "failed": 0}
+
+    # --- Lifecycle ---
+
+    def start(self) -> None:
+        """Starts the writer thread. Called lazily on first use."""
+        with self._lock:
+            if self._thread is not None or self.writer is None:
+                return
+            self._thread = threading.Thread(target=self._writer_loop, name="quiz-answer-log", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        """Writes the pending events, stops the writer thread and closes the writer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        atexit.unregister(self.stop)
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"Answer log writer did not finish within {timeout}s; "
+                           f"about {self._queue.qsize()} events were not written.")
+            return
+        self.writer.close()
+
+    def flush(self, timeout: float | None = 5.0) -> bool:
+        """Waits until every event recorded so far is written. Returns False on timeout."""
+        if self._thread is None:
+            return True
+        written = threading.Event()
+        try:
+            self._queue.put(written, timeout=timeout)
+        except queue.Full:
+            return False
+        return written.wait(timeout)
+
+    # --- Request path ---
+
+    def record(self, event: AnswerEvent) -> bool:
+        """Queues an event without blocking. Returns False if it was dropped (or logging is disabled)."""
+        if self.writer is None:
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("queued")
+        return True
+
+    # --- Queries ---
+
+    def accuracy(self, topic: str | None = None, question_id: str | None = None, limit: int = 100) -> list[dict]:
+        """Per-question accuracy of written events (see AnswerEventWriter.accuracy)."""
+        return self.writer.accuracy(topic, question_id, limit) if self.writer else []
+
+    def item_stats(self, question_id: str) -> list[dict]:
+        return self.writer.item_stats(question_id) if self.writer else []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts, pending=self._queue.qsize())
+
+    # --- Internals ---
+
+    def _count(self, outcome: str, amount: int = 1) -> None:
+        ANSWER_EVENTS_TOTAL.inc(amount, outcome=outcome)
+        with self._lock:
+            self._counts[outcome] += amount
+
+    def _writer_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[AnswerEvent] = []
+            waiters: list[threading.Event] = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stopping or waiters or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if stopping:  # Drain what is left without waiting
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+            self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, events: list[AnswerEvent]) -> None:
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            try:
+                with ANSWER_LOG_WRITE_SECONDS.time():
+                    self.writer.write(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} answer events: {type(e).__name__} - {e}")
+                self._count("failed", len(batch))
+            else:
+                self._count("written", len(batch))
+
+
+def create_answer_log(path: str = ANSWER_LOG_PATH) -> AnswerEventLog:
+    """A log writing to `path`: JSONL for *.jsonl paths, otherwise SQLite. An empty path disables it."""
+    if not path:
+        return AnswerEventLog(None)
+    writer = JSONLAnswerEventWriter(path) if path.endswith(".jsonl") else SQLiteAnswerEventWriter(path)
+    return AnswerEventLog(writer)
@@ -0,0 +1,147 @@
+"""
+Fingerprinted, precompressed static assets.
+
+At startup every file under the static folder is read once, hashed and
+compressed (gzip, plus brotli when available). Templates link to assets with
+`asset_url('style.css')`, which yields a content-addressed URL such as
+/assets/style.3f2a9c1b7d4e.css. Those URLs never change meaning, so they are
+served with a year-long immutable cache policy: a browser fetches each asset
+version once and reuses it for the whole session and beyond.
+
+Build the manifest without starting the server (e.g. to check it in CI):
+
+    python -m app.assets
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from dataclasses import dataclass, field
+
+from flask import Flask, Response, abort, request, url_for
+
+from .compression import COMPRESSIBLE_MIMETYPES, available_encodings, compress, negotiate_encoding
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+ASSET_MAX_AGE = int(os.getenv("QUIZ_ASSET_MAX_AGE", str(365 * 24 * 3600)))  # Seconds fingerprinted assets may be cached
+ASSET_HASH_LENGTH = 12
+ASSET_URL_PREFIX = "/assets"
+
+# Assets are compressed once, so the slowest, smallest settings are worth it.
+_PRECOMPRESS_LEVELS = {"br": 11, "gzip": 9}
+
+
+@dataclass(frozen=True)
+class Asset:
+    """One static file with its fingerprinted name and precompressed bodies."""
+    path: str             # Relative to the static folder, with forward slashes
+    hashed_path: str      # e.g. "js/drag_drop.1a2b3c4d5e6f.js"
+    digest: str
+    mimetype: str
+    body: bytes
+    encoded: dict[str, bytes] = field(default_factory=dict)  # Content coding -> body, only where smaller
+
+
+def _hashed_path(path: str, digest: str) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _load_asset(static_folder: str, path: str) -> Asset:
+    with open(os.path.join(static_folder, path), "rb") as handle:
+        body = handle.read()
+    digest = hashlib.sha256(body).hexdigest()[:ASSET_HASH_LENGTH]
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    encoded = {}
+    if mimetype in COMPRESSIBLE_MIMETYPES:
+        for encoding in available_encodings():
+            data = compress(body, encoding, _PRECOMPRESS_LEVELS[encoding])
+            if len(data) < len(body):
+                encoded[encoding] = data
+    return Asset(path, _hashed_path(path, digest), digest, mimetype, body, encoded)
+
+
+class AssetManifest:
+    """Maps logical asset paths to fingerprinted ones and holds their bodies in memory."""
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self._by_path: dict[str, Asset] = {}
+        self._by_hashed_path: dict[str, Asset] = {}
+        self._lock = threading.Lock()
+
+    def build(self) -> int:
+        """(Re)reads and compresses every static file. Returns how many assets there are."""
+        by_path = {}
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), self.static_folder).replace(os.sep, "/")
+                by_path[path] = _load_asset(self.static_folder, path)
+        with self._lock:
+            self._by_path = by_path
+            self._by_hashed_path = {asset.hashed_path: asset for asset in by_path.values()}
+        raw = sum(len(asset.body) for asset in by_path.values())
+        packed = sum(len(asset.encoded.get("gzip", asset.body)) for asset in by_path.values())
+        logger.info(f"Built {len(by_path)} fingerprinted assets ({raw} bytes, {packed} gzipped).")
+        return len(by_path)
+
+    def get(self, path: str) -> Asset | None:
+        with self._lock:
+            return self._by_path.get(path)
+
+    def get_hashed(self, hashed_path: str) -> Asset | None:
+        with self._lock:
+            return self._by_hashed_path.get(hashed_path)
+
+    def as_dict(self) -> dict[str, str]:
+        """Logical path -> fingerprinted path."""
+        with self._lock:
+            return {path: asset.hashed_path for path, asset in sorted(self._by_path.items())}
+
+
+def init_app(app: Flask) -> AssetManifest:
+    """
+    Builds the asset manifest for the app's static folder, serves it under
+    ASSET_URL_PREFIX and makes `asset_url(path)` available to templates.
+    """
+    manifest = AssetManifest(app.static_folder)
+    manifest.build()
+
+    def asset_url(path: str) -> str:
+        """Fingerprinted URL for a static file; unknown files fall back to the plain static URL."""
+        asset = manifest.get(path)
+        if asset is None:
+            return url_for('static', filename=path)
+        return url_for('serve_asset', filename=asset.hashed_path)
+
+    def serve_asset(filename: str):
+        asset = manifest.get_hashed(filename)
+        if asset is None:
+            abort(404)
+        encoding = negotiate_encoding(request.accept_encodings, tuple(asset.encoded))
+        response = Response(asset.encoded[encoding] if encoding else asset.body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.encoded:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(asset.digest, weak=bool(encoding))
+        response.headers['Cache-Control'] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+        return response.make_conditional(request)
+
+    app.add_url_rule(f"{ASSET_URL_PREFIX}/<path:filename>", endpoint='serve_asset', view_func=serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.extensions['quiz_assets'] = manifest
+    return manifest
+
+
+if __name__ == '__main__':
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+    static_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    manifest = AssetManifest(static_folder)
+    manifest.build()
+    print(json.dumps(manifest.as_dict(), indent=2))
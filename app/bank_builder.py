@@ -0,0 +1,301 @@
+"""
+Offline question-bank builder.
+
+Generates questions for a list of topics ahead of time, so peak-hour traffic
+is served from the bank instead of waiting on the LLM:
+
+    python -m app.bank_builder topics.txt --per-type 20 --output quiz_question_bank.sqlite3
+    python -m app.bank_builder --topics "Solar System" "Cell Biology" --per-type 10 --output questions.jsonl
+
+Work is split into batched LLM calls (`--batch-size` questions each) that run
+on `--workers` threads, started at most `--rate` times per second. Every
+question is validated, and fallbacks and near-duplicates are dropped before
+anything is written. Output goes to a question bank (SQLite) or a JSONL
+file, and each batch is committed as soon as it arrives. The output doubles
+as the checkpoint: re-running the same command counts what is already there
+and only generates the shortfall, so an interrupted run resumes where it
+stopped.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from pydantic import ValidationError
+
+from .dedup import NearDuplicateIndex
+from .llm_backends import create_backend
+from .llm_integration import (
+    QUESTION_MODELS,
+    QuizQuestionGenerator,
+    get_generator,
+    is_fallback_question,
+    normalize_topic,
+    set_generator,
+)
+from .llm_scheduler import Priority, llm_priority
+from .question_bank import QuestionBank
+from .question_models import AnyQuizQuestionModel, parse_question_json, question_to_json
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+BUILDER_WORKERS = int(os.getenv("QUIZ_BUILDER_WORKERS", "8"))
+BUILDER_RATE = float(os.getenv("QUIZ_BUILDER_RATE", "2"))  # LLM calls started per second (0 for no limit)
+BUILDER_BATCH_SIZE = int(os.getenv("QUIZ_BUILDER_BATCH_SIZE", "5"))  # Questions asked for per LLM call
+BUILDER_MAX_ATTEMPTS = int(os.getenv("QUIZ_BUILDER_MAX_ATTEMPTS", "3"))  # Calls per batch before giving up on its shortfall
+
+
+class RateLimiter:
+    """Spaces out call starts to at most `rate` per second across threads (0 for no limit)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+# --- Output sinks ---
+
+class BankSink:
+    """Writes into a QuestionBank (SQLite); its validation and dedup decide what is kept."""
+
+    def __init__(self, path: str):
+        # The builder must not evict what it just generated.
+        self.bank = QuestionBank(path=path, max_entries=sys.maxsize)
+
+    def existing_count(self, topic: str, question_type: str) -> int:
+        return self.bank.count(topic, question_type)
+
+    def write(self, questions: list[AnyQuizQuestionModel]) -> int:
+        return len(self.bank.store_new(questions))
+
+    def close(self) -> None:
+        self.bank.close()
+
+
+class JSONLSink:
+    """
+    Appends one question per line, skipping ids already in the file.
+    Existing lines are read back on start for the resume counts, the ids and
+    the near-duplicate index; a torn last line from an interrupted run is
+    skipped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dedup = NearDuplicateIndex()
+        self._ids: set[str] = set()
+        self._counts: Counter[tuple[str, str]] = Counter()
+        self._lock = threading.Lock()
+        torn = self._load_existing()
+        self._handle = open(path, "a", encoding="utf-8")
+        if torn:
+            self._handle.write("\n")  # Keep the next line from being glued onto the torn one
+
+    def _load_existing(self) -> bool:
+        """Loads counts and signatures. Returns whether the file ends mid-line."""
+        if not os.path.exists(self.path):
+            return False
+        by_topic: dict[str, list[AnyQuizQuestionModel]] = {}
+        line = ""
+        with open(self.path, encoding="utf-8") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    question = parse_question_json(line)
+                except ValidationError:
+                    logger.warning(f"{self.path}:{line_number}: not a valid question; ignored.")
+                    continue
+                if question.id in self._ids:
+                    continue
+                self._ids.add(question.id)
+                topic_key = normalize_topic(question.topic)
+                by_topic.setdefault(topic_key, []).append(question)
+                self._counts[(topic_key, question.question_type)] += 1
+        for topic_key, questions in by_topic.items():
+            self.dedup.load(topic_key, questions)
+        logger.info(f"Resuming '{self.path}' with {sum(self._counts.values())} existing questions.")
+        return bool(line) and not line.endswith("\n")
+
+    def existing_count(self, topic: str, question_type: str) -> int:
+        with self._lock:
+            return self._counts[(normalize_topic(topic), question_type)]
+
+    def write(self, questions: list[AnyQuizQuestionModel]) -> int:
+        written = 0
+        with self._lock:
+            for question in questions:
+                if is_fallback_question(question) or question.id in self._ids:
+                    continue
+                topic_key = normalize_topic(question.topic)
+                if self.dedup.add(topic_key, question) is not None:
+                    continue
+                self._ids.add(question.id)
+                self._handle.write(question_to_json(question).decode('utf-8') + "\n")
+                self._counts[(topic_key, question.question_type)] += 1
+                written += 1
+            self._handle.flush()
+            os.fsync(self._handle.fileno())  # The file is the checkpoint
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+def open_sink(path: str) -> BankSink | JSONLSink:
+    """A JSONL sink for *.jsonl paths, otherwise a SQLite question bank."""
+    return JSONLSink(path) if path.endswith(".jsonl") else BankSink(path)
+
+
+# --- Build ---
+
+def _report_key(topic: str, question_type: str) -> str:
+    return f"{normalize_topic(topic)}/{question_type}"
+
+
+def build_bank(topics: list[str], per_type: int, sink: BankSink | JSONLSink,
+               question_types: tuple[str, ...] = tuple(QUESTION_MODELS),
+               workers: int = BUILDER_WORKERS, rate: float = BUILDER_RATE,
+               batch_size: int = BUILDER_BATCH_SIZE, max_attempts: int = BUILDER_MAX_ATTEMPTS) -> dict:
+    """
+    Fills `sink` up to `per_type` questions for every topic and type.
+
+    Topics that normalize to the same bucket ("Solar System", "solar system")
+    are built once, under the first spelling given.
+
+    Returns:
+        Per "topic/type" key (with the normalized topic): the target, how
+        many questions existed before the run, how many were written and the
+        remaining shortfall.
+    """
+    limiter = RateLimiter(rate)
+    generator = get_generator()
+    if generator.coalesce:
+        # Jobs for the same topic, type and size would otherwise share one in-flight
+        # call, and with it the same questions.
+        generator = QuizQuestionGenerator(backend=generator.backend, coalesce=False,
+                                          scheduler=generator.scheduler, breaker=generator.breaker)
+    unique_topics: dict[str, str] = {}  # Normalized topic -> first spelling, in order
+    for topic in topics:
+        unique_topics.setdefault(normalize_topic(topic), topic)
+    topics = list(unique_topics.values())
+    report: dict[str, dict[str, int]] = {}
+    jobs: list[tuple[str, str, int]] = []
+    for topic in topics:
+        for question_type in question_types:
+            existing = sink.existing_count(topic, question_type)
+            report[_report_key(topic, question_type)] = {"target": per_type, "existing": existing, "written": 0, "calls": 0}
+            missing = per_type - existing
+            while missing > 0:
+                jobs.append((topic, question_type, min(batch_size, missing)))
+                missing -= batch_size
+
+    def run_batch(topic: str, question_type: str, count: int) -> int:
+        limiter.acquire()
+        with llm_priority(Priority.BULK):  # Never delays quiz takers sharing the quota
+            questions = generator.generate_batch(topic, count, {question_type: 1})
+        return sink.write([q for q in questions if q.question_type == question_type])
+
+    logger.info(f"Generating {sum(job[2] for job in jobs)} questions in {len(jobs)} batches "
+                f"for {len(topics)} topic(s) with {workers} worker(s).")
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="quiz-bank-builder")
+    pending: dict[Future, tuple[str, str, int, int]] = {}
+    try:
+        for topic, question_type, count in jobs:
+            pending[executor.submit(run_batch, topic, question_type, count)] = (topic, question_type, count, 1)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                topic, question_type, count, attempt = pending.pop(future)
+                entry = report[_report_key(topic, question_type)]
+                entry["calls"] += 1
+                try:
+                    written = future.result()
+                except Exception as e:
+                    logger.error(f"Batch for '{topic}' ({question_type}) failed: {type(e).__name__} - {e}")
+                    written = 0
+                entry["written"] += written
+                shortfall = count - written
+                if shortfall > 0 and attempt < max_attempts:
+                    # Dropped duplicates or invalid items; ask again for just the difference.
+                    retry = executor.submit(run_batch, topic, question_type, shortfall)
+                    pending[retry] = (topic, question_type, shortfall, attempt + 1)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; finished batches are saved. Re-run the same command to resume.")
+        for future in pending:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    for entry in report.values():
+        entry["shortfall"] = max(entry["target"] - entry["existing"] - entry["written"], 0)
+    logger.info(f"Bank build finished in {time.perf_counter() - start:.1f}s.")
+    return report
+
+
+def _read_topics(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as handle:
+        return [line.strip() for line in handle if line.strip() and not line.lstrip().startswith("#")]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-generate quiz questions into a question bank or JSONL file.")
+    parser.add_argument("topics_file", nargs="?", help="File with one topic per line ('#' comments allowed)")
+    parser.add_argument("--topics", nargs="+", default=[], help="Topics given inline (added to topics_file)")
+    parser.add_argument("--per-type", type=int, required=True, help="Questions wanted per topic and question type")
+    parser.add_argument("--types", nargs="+", default=list(QUESTION_MODELS), choices=list(QUESTION_MODELS))
+    parser.add_argument("--output", default=os.getenv("QUIZ_QUESTION_BANK_PATH", "quiz_question_bank.sqlite3"),
+                        help="SQLite question bank, or a .jsonl file")
+    parser.add_argument("--workers", type=int, default=BUILDER_WORKERS)
+    parser.add_argument("--rate", type=float, default=BUILDER_RATE, help="LLM calls started per second (0 for no limit)")
+    parser.add_argument("--batch-size", type=int, default=BUILDER_BATCH_SIZE)
+    parser.add_argument("--max-attempts", type=int, default=BUILDER_MAX_ATTEMPTS)
+    parser.add_argument("--backend", help="LLM backend to use instead of QUIZ_LLM_BACKEND (gemini, stub, replay)")
+    args = parser.parse_args(argv)
+
+    topics = (_read_topics(args.topics_file) if args.topics_file else []) + args.topics
+    if not topics:
+        parser.error("no topics given")
+    # Every batch needs its own LLM call (see build_bank), so coalescing is off.
+    set_generator(QuizQuestionGenerator(backend=create_backend(args.backend) if args.backend else None, coalesce=False))
+
+    sink = open_sink(args.output)
+    try:
+        report = build_bank(topics, args.per_type, sink, tuple(args.types), args.workers, args.rate,
+                            args.batch_size, args.max_attempts)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        sink.close()
+
+    print(f"{'topic/type':<40}{'target':>8}{'existing':>10}{'written':>9}{'calls':>7}{'short':>7}")
+    for key, entry in report.items():
+        print(f"{key:<40}{entry['target']:>8}{entry['existing']:>10}{entry['written']:>9}{entry['calls']:>7}{entry['shortfall']:>7}")
+    print(json.dumps({"written": sum(e["written"] for e in report.values()),
+                      "shortfall": sum(e["shortfall"] for e in report.values())}))
+    return 1 if any(entry["shortfall"] for entry in report.values()) else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
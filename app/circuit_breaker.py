@@ -0,0 +1,239 @@
+"""
+Circuit breaker for LLM calls.
+
+While the backend is healthy the circuit is CLOSED and every call goes
+through. The breaker keeps the outcomes of recent calls in a sliding window.
+A call that raised, or took longer than `slow_call_seconds`, counts against
+the backend. Once enough calls have been seen and the failure rate or the
+slow-call rate reaches its threshold, the circuit OPENS. From then on, calls
+are refused at once with CircuitOpen: the generator serves a fallback (and
+the question bank a stored question) instead of holding a worker until the
+call fails.
+
+After `open_seconds` the circuit goes HALF_OPEN and lets up to
+`half_open_calls` probe calls through. If they all succeed the circuit
+closes again; if any of them fails it re-opens for another `open_seconds`.
+
+    with breaker.call():
+        response = backend.generate(prompt, question_type)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from .metrics import LLM_CIRCUIT_CALLS_TOTAL, LLM_CIRCUIT_STATE, LLM_CIRCUIT_TRANSITIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+BREAKER_WINDOW_SECONDS = float(os.getenv("QUIZ_BREAKER_WINDOW", "60"))  # Outcomes older than this are forgotten
+BREAKER_MIN_CALLS = int(os.getenv("QUIZ_BREAKER_MIN_CALLS", "5"))  # Calls in the window before the breaker may trip
+BREAKER_FAILURE_RATE = float(os.getenv("QUIZ_BREAKER_FAILURE_RATE", "0.5"))  # Share of failed calls that opens the circuit
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("QUIZ_BREAKER_SLOW_CALL", "10"))  # Slower calls count as slow (0 disables)
+BREAKER_SLOW_CALL_RATE = float(os.getenv("QUIZ_BREAKER_SLOW_CALL_RATE", "0.8"))  # Share of slow calls that opens the circuit
+BREAKER_OPEN_SECONDS = float(os.getenv("QUIZ_BREAKER_OPEN_SECONDS", "30"))  # How long the circuit stays open
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("QUIZ_BREAKER_HALF_OPEN_CALLS", "2"))  # Probe calls allowed while half-open
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+class CircuitOpen(Exception):
+    """The circuit is open (or its half-open probes are taken), so the call was not made."""
+
+
+class CircuitBreaker:
+    """
+    Error-rate and latency based circuit breaker, safe to share between
+    threads and event loops. `name` labels the metrics (normally the backend
+    name).
+
+    Use `call()` around the backend call, or `allow()` followed by
+    `record_success`/`record_failure` where a context manager does not fit.
+    Exceptions listed in `ignored` (e.g. a caller's own deadline giving up
+    in the queue) neither count as failures nor as successes.
+    """
+
+    def __init__(self, name: str = "llm",
+                 window_seconds: float = BREAKER_WINDOW_SECONDS,
+                 min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+                 open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS,
+                 ignored: tuple[type[BaseException], ...] = ()):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(min_calls, 1)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(half_open_calls, 1)
+        self.ignored = ignored
+
+        self._lock = threading.Lock()
+        self._outcomes: deque[tuple[float, bool, bool]] = deque()  # (time, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._publish_state()
+
+    # --- Calls ---
+
+    @contextmanager
+    def call(self, timed: bool = True) -> Iterator[None]:
+        """
+        Guards one backend call.
+
+        Args:
+            timed: Whether the call's duration counts towards the slow-call
+                rate. Pass False for calls whose length says nothing about
+                backend health, such as large batches or streams.
+
+        Raises:
+            CircuitOpen: On entry, when the call is not allowed.
+        """
+        self.allow()
+        start = time.monotonic()
+        try:
+            yield
+        except self.ignored:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:  # Cancelled or interrupted: says nothing about the backend
+            self.release()
+            raise
+        self.record_success(time.monotonic() - start if timed else None)
+
+    def allow(self) -> None:
+        """
+        Admits a call, or raises CircuitOpen. Every admitted call must be
+        followed by `record_success`, `record_failure` or `release`.
+        """
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._transition_locked(HALF_OPEN)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_calls - self._probe_successes:
+                self._probes_in_flight += 1
+                return
+            state = self._state
+            retry_in = max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+        LLM_CIRCUIT_CALLS_TOTAL.inc(backend=self.name, outcome="rejected")
+        raise CircuitOpen(f"LLM circuit '{self.name}' is {state}; next probe in {retry_in:.0f}s.")
+
+    def check(self) -> None:
+        """Raises CircuitOpen if a call would be refused right now, without admitting one."""
+        with self._lock:
+            if self._state != OPEN or time.monotonic() - self._opened_at >= self.open_seconds:
+                return
+        LLM_CIRCUIT_CALLS_TOTAL.inc(backend=self.name, outcome="rejected")
+        raise CircuitOpen(f"LLM circuit '{self.name}' is open.")
+
+    def record_success(self, seconds: float | None = None) -> None:
+        slow = seconds is not None and self.slow_call_seconds > 0 and seconds >= self.slow_call_seconds
+        LLM_CIRCUIT_CALLS_TOTAL.inc(backend=self.name, outcome="slow" if slow else "success")
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if slow:
+                    self._transition_locked(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition_locked(CLOSED)
+                return
+            self._record_locked(failed=False, slow=slow)
+
+    def record_failure(self) -> None:
+        LLM_CIRCUIT_CALLS_TOTAL.inc(backend=self.name, outcome="failure")
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                self._transition_locked(OPEN)
+                return
+            self._record_locked(failed=True, slow=False)
+
+    def release(self) -> None:
+        """Returns an admitted call's slot without recording an outcome."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    # --- State ---
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN  # Becomes so on the next call
+            return self._state
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._trim_locked(time.monotonic())
+            calls = len(self._outcomes)
+            return {
+                "state": self._state,
+                "calls_in_window": calls,
+                "failure_rate": sum(failed for _, failed, _ in self._outcomes) / calls if calls else 0.0,
+                "slow_call_rate": sum(slow for _, _, slow in self._outcomes) / calls if calls else 0.0,
+            }
+
+    def reset(self) -> None:
+        """Closes the circuit and forgets recorded outcomes."""
+        with self._lock:
+            self._outcomes.clear()
+            self._transition_locked(CLOSED)
+
+    # --- Internals ---
+
+    def _trim_locked(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _record_locked(self, failed: bool, slow: bool) -> None:
+        now = time.monotonic()
+        self._outcomes.append((now, failed, slow))
+        self._trim_locked(now)
+        if self._state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        calls = len(self._outcomes)
+        failures = sum(failed for _, failed, _ in self._outcomes) / calls
+        slow_calls = sum(slow for _, _, slow in self._outcomes) / calls
+        if failures >= self.failure_rate or (self.slow_call_seconds > 0 and slow_calls >= self.slow_call_rate):
+            logger.error(f"Opening LLM circuit '{self.name}' for {self.open_seconds:g}s: "
+                         f"{failures:.0%} failed and {slow_calls:.0%} slow of the last {calls} calls.")
+            self._transition_locked(OPEN)
+
+    def _transition_locked(self, state: str) -> None:
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != self._state:
+            if state == CLOSED:
+                logger.info(f"Closing LLM circuit '{self.name}'.")
+                self._outcomes.clear()
+            elif state == HALF_OPEN:
+                logger.info(f"LLM circuit '{self.name}' is half-open; letting {self.half_open_calls} probe call(s) through.")
+            self._state = state
+            LLM_CIRCUIT_TRANSITIONS_TOTAL.inc(backend=self.name, state=state)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._publish_state()
+
+    def _publish_state(self) -> None:
+        for state in STATES:
+            LLM_CIRCUIT_STATE.set(1 if state == self._state else 0, backend=self.name, state=state)
@@ -0,0 +1,96 @@
+"""
+Response compression.
+
+Rendered HTML and JSON responses are compressed on the way out when the
+client accepts it: brotli if the optional `brotli` package is installed,
+otherwise gzip. Streamed responses (server-sent events) are left alone.
+"""
+import gzip
+import logging
+import os
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+COMPRESS_MIN_SIZE = int(os.getenv("QUIZ_COMPRESS_MIN_SIZE", "500"))  # Smaller bodies are sent as-is
+COMPRESS_LEVEL = int(os.getenv("QUIZ_COMPRESS_LEVEL", "6"))  # gzip level for per-request compression
+BROTLI_QUALITY = int(os.getenv("QUIZ_BROTLI_QUALITY", "5"))  # brotli quality for per-request compression
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "image/svg+xml",
+}
+
+
+def available_encodings() -> tuple[str, ...]:
+    """Content codings this process can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encodings, offered: tuple[str, ...] | None = None) -> str | None:
+    """
+    Picks the content coding to send.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding (`request.accept_encodings`).
+        offered: Codings available for this body; defaults to `available_encodings()`.
+
+    Returns:
+        "br", "gzip", or None for the identity coding.
+    """
+    for encoding in offered if offered is not None else available_encodings():
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+    """Compresses `data` with "br" or "gzip". `level` is the brotli quality or gzip level."""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    # mtime=0 keeps the output (and anything hashed from it) identical across runs.
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL if level is None else level, mtime=0)
+
+
+def _compress_response(response: Response) -> Response:
+    if (response.status_code != 200
+            or response.is_streamed
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The encoded bytes differ from the identity ones, so a strong validator no longer holds.
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app: Flask) -> None:
+    """
+    Compresses the app's non-streamed text responses.
+
+    Flask runs after_request hooks in reverse order of registration, so call
+    this after registering hooks that time the response to include compression
+    in the timing.
+    """
+    app.after_request(_compress_response)
+    if brotli is None:
+        logger.info("brotli is not installed; responses and assets are compressed with gzip only.")
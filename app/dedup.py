@@ -0,0 +1,172 @@
+"""
+Near-duplicate detection for generated questions.
+
+Each question is reduced to a set of shingles (word 3-grams of its text plus
+its answer set) and a MinHash signature of that set. Signatures are bucketed
+per topic with LSH banding, so checking a new question only compares it with
+the few stored questions that share a band, not with the whole topic.
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+
+from .question_models import AnyQuizQuestionModel
+
+# --- Configuration (overridable through the environment) ---
+DEDUP_THRESHOLD = float(os.getenv("QUIZ_DEDUP_THRESHOLD", "0.8"))  # Estimated Jaccard similarity that counts as a duplicate
+DEDUP_MAX_PER_TOPIC = int(os.getenv("QUIZ_DEDUP_MAX_PER_TOPIC", "2000"))  # Oldest signatures are forgotten beyond this
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands of 4 rows: pairs above ~0.7 similarity almost always share a band
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MASK_64 = (1 << 64) - 1
+_WORD = re.compile(r"\w+")
+
+_rng = random.Random(0x51A7)  # Fixed, so signatures are comparable across processes and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), "big")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(text.casefold())
+
+
+def question_shingles(question: AnyQuizQuestionModel) -> set[str]:
+    """Word 3-grams of the question text, plus one shingle per option or match."""
+    words = _words(question.question_text)
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    if question.question_type == "MCQ":
+        for option in question.options:
+            shingles.add("opt:" + " ".join(_words(option)))
+    else:
+        for item, target in question.correct_matches.items():
+            shingles.add("match:" + " ".join(_words(item)) + "->" + " ".join(_words(target)))
+    return shingles
+
+
+def minhash_signature(shingles: set[str]) -> tuple[int, ...]:
+    """MinHash signature of a shingle set (NUM_PERMUTATIONS values)."""
+    hashes = [_hash64(shingle) for shingle in shingles] or [0]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MASK_64 for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimated_similarity(first: tuple[int, ...], second: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+def _bands(signature: tuple[int, ...]) -> list[tuple[int, int]]:
+    rows = len(signature) // LSH_BANDS
+    return [(band, hash(signature[band * rows:(band + 1) * rows])) for band in range(LSH_BANDS)]
+
+
+class _TopicIndex:
+    def __init__(self):
+        self.signatures: OrderedDict[str, tuple[int, ...]] = OrderedDict()
+        self.buckets: dict[tuple[int, int], set[str]] = {}
+
+    def add(self, question_id: str, signature: tuple[int, ...]) -> None:
+        self.remove(question_id)
+        self.signatures[question_id] = signature
+        for band in _bands(signature):
+            self.buckets.setdefault(band, set()).add(question_id)
+
+    def remove(self, question_id: str) -> None:
+        signature = self.signatures.pop(question_id, None)
+        if signature is None:
+            return
+        for band in _bands(signature):
+            bucket = self.buckets.get(band)
+            if bucket is not None:
+                bucket.discard(question_id)
+                if not bucket:
+                    del self.buckets[band]
+
+
+class NearDuplicateIndex:
+    """
+    Per-topic MinHash/LSH index of question signatures.
+
+    Topics are keyed by the caller (normally the normalized topic). Each
+    topic keeps at most `max_per_topic` signatures, forgetting the oldest.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, max_per_topic: int = DEDUP_MAX_PER_TOPIC):
+        self.threshold = threshold
+        self.max_per_topic = max_per_topic
+        self._topics: dict[str, _TopicIndex] = {}
+        self._lock = threading.Lock()
+
+    def has_topic(self, topic_key: str) -> bool:
+        with self._lock:
+            return topic_key in self._topics
+
+    def find_duplicate(self, topic_key: str, question: AnyQuizQuestionModel, signature: tuple[int, ...] | None = None) -> str | None:
+        """Returns the id of an indexed near-duplicate of `question` in the topic, or None."""
+        signature = signature or minhash_signature(question_shingles(question))
+        with self._lock:
+            return self._find_locked(topic_key, question.id, signature)
+
+    def add(self, topic_key: str, question: AnyQuizQuestionModel) -> str | None:
+        """
+        Indexes the question unless it near-duplicates one already in the topic.
+
+        Returns:
+            None if the question was added, else the id of the question it duplicates.
+        """
+        signature = minhash_signature(question_shingles(question))
+        question_id = question.id
+        with self._lock:
+            duplicate_of = self._find_locked(topic_key, question_id, signature)
+            if duplicate_of is not None:
+                return duplicate_of
+            index = self._topics.setdefault(topic_key, _TopicIndex())
+            index.add(question_id, signature)
+            while len(index.signatures) > self.max_per_topic:
+                index.remove(next(iter(index.signatures)))
+        return None
+
+    def load(self, topic_key: str, questions: list[AnyQuizQuestionModel]) -> None:
+        """(Re)builds a topic from stored questions, without duplicate checks."""
+        index = _TopicIndex()
+        for question in questions[-self.max_per_topic:]:
+            index.add(question.id, minhash_signature(question_shingles(question)))
+        with self._lock:
+            self._topics[topic_key] = index
+
+    def remove(self, topic_key: str, question_id: str) -> None:
+        with self._lock:
+            index = self._topics.get(topic_key)
+            if index is not None:
+                index.remove(question_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._topics.clear()
+
+    def _find_locked(self, topic_key: str, question_id: str | None, signature: tuple[int, ...]) -> str | None:
+        index = self._topics.get(topic_key)
+        if index is None:
+            return None
+        candidates = set()
+        for band in _bands(signature):
+            candidates |= index.buckets.get(band, set())
+        candidates.discard(question_id)  # Re-storing the same question is not a duplicate
+        for candidate in candidates:
+            if estimated_similarity(signature, index.signatures[candidate]) >= self.threshold:
+                return candidate
+        return None
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Iterator
+
+from .llm_backends import LLMBackend
+from .llm_integration import QuizQuestionGenerator, set_generator
+from .llm_scheduler import LLMScheduler
+
+# --- Deterministic local stand-in for the Gemini model ---
+# Used by the benchmarks (and handy for offline development): it understands
+# the prompts built by QuizQuestionGenerator, answers with schema-valid
+# questions after a configurable delay and can be told to emit broken JSON.
+
+_TOPIC_PATTERN = re.compile(r"about the topic: '(.*?)'")
+_BATCH_MCQ_PATTERN = re.compile(r"(\d+) Multiple-Choice")
+_BATCH_DAD_PATTERN = re.compile(r"(\d+) Drag-and-Drop")
+
+
+class FakeResponse:
+    """Mimics the parts of a google.generativeai response the app reads."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.prompt_feedback = None
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in replacement for genai.GenerativeModel.
+
+    Every call draws from its own Random seeded by (seed, call number), so a
+    run with the same seed and call order produces the same questions,
+    delays and malformed responses.
+
+    Args:
+        latency: Mean seconds per call.
+        jitter: Maximum +/- seconds added to the latency.
+        malformed_rate: Probability (0-1) of returning invalid JSON.
+        seed: Seed for all randomness.
+        stream_chunk_size: Characters per chunk when streaming.
+    """
+
+    def __init__(self, model_name: str = "fake-llm", latency: float = 0.05, jitter: float = 0.02,
+                 malformed_rate: float = 0.0, seed: int = 0, stream_chunk_size: int = 64):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    # --- genai.GenerativeModel interface ---
+
+    def generate_content(self, prompt: str, generation_config=None, stream: bool = False, **kwargs):
+        rng = self._next_rng()
+        delay = self._delay(rng)
+        text = self._respond(prompt, rng)
+        if stream:
+            return self._stream(text, delay)
+        time.sleep(delay)
+        return FakeResponse(text)
+
+    async def generate_content_async(self, prompt: str, generation_config=None, **kwargs):
+        rng = self._next_rng()
+        delay = self._delay(rng)
+        text = self._respond(prompt, rng)
+        await asyncio.sleep(delay)
+        return FakeResponse(text)
+
+    # --- Internals ---
+
+    def _next_rng(self) -> random.Random:
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        return random.Random(f"{self.seed}:{call_number}")
+
+    def _delay(self, rng: random.Random) -> float:
+        return max(self.latency + rng.uniform(-self.jitter, self.jitter), 0.0)
+
+    def _stream(self, text: str, delay: float):
+        chunks = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)] or [""]
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield FakeResponse(chunk)
+
+    def _respond(self, prompt: str, rng: random.Random) -> str:
+        match = _TOPIC_PATTERN.search(prompt)
+        topic = match.group(1) if match else "General Knowledge"
+
+        if "JSON array" in prompt:
+            mcq_match = _BATCH_MCQ_PATTERN.search(prompt)
+            dad_match = _BATCH_DAD_PATTERN.search(prompt)
+            questions = [fake_mcq_question(topic, rng) for _ in range(int(mcq_match.group(1)) if mcq_match else 0)]
+            questions += [fake_dad_question(topic, rng) for _ in range(int(dad_match.group(1)) if dad_match else 0)]
+            text = json.dumps(questions)
+        elif "Drag-and-Drop" in prompt:
+            text = json.dumps(fake_dad_question(topic, rng))
+        else:
+            text = json.dumps(fake_mcq_question(topic, rng))
+
+        if rng.random() < self.malformed_rate:
+            text = _corrupt(text, rng)
+        return text
+
+
+def _suffix(rng: random.Random) -> str:
+    return f"{rng.randrange(16 ** 8):08x}"
+
+
+def fake_mcq_question(topic: str, rng: random.Random) -> dict:
+    suffix = _suffix(rng)
+    options = [f"Option {letter} ({suffix})" for letter in "ABCD"]
+    return {
+        "id": f"q_{topic.replace(' ', '_').lower()}_mcq_{suffix}",
+        "topic": topic,
+        "question_text": f"[{topic}] Which statement is correct? (fake #{suffix})",
+        "question_type": "MCQ",
+        "options": options,
+        "correct_answer": rng.choice(options),
+        "explanation": "Generated by the fake LLM backend.",
+    }
+
+
+def fake_dad_question(topic: str, rng: random.Random) -> dict:
+    suffix = _suffix(rng)
+    count = rng.randint(3, 5)
+    items = [f"Item {i} ({suffix})" for i in range(1, count + 1)]
+    targets = [f"Target {i} ({suffix})" for i in range(1, count + 1)]
+    shuffled = targets[:]
+    rng.shuffle(shuffled)
+    return {
+        "id": f"q_{topic.replace(' ', '_').lower()}_dad_{suffix}",
+        "topic": topic,
+        "question_text": f"[{topic}] Match each item to its target. (fake #{suffix})",
+        "question_type": "DAD",
+        "draggable_items": items,
+        "drop_targets": targets,
+        "correct_matches": dict(zip(items, shuffled)),
+        "explanation": "Generated by the fake LLM backend.",
+    }
+
+
+def _corrupt(text: str, rng: random.Random) -> str:
+    """Breaks the JSON the way real model output tends to break."""
+    kind = rng.choice(("truncate", "trailing_comma", "prose"))
+    if kind == "truncate":
+        return text[: max(len(text) // 2, 1)]
+    if kind == "trailing_comma":
+        return text[:-1] + ",}" if text.endswith("}") else text[:-1] + ",]"
+    return "Sure! Here is your question:\n" + text + "\nLet me know if you need more."
+
+
+# --- The "stub" LLM backend ---
+STUB_LATENCY = float(os.getenv("QUIZ_STUB_LATENCY", "0.05"))
+STUB_MALFORMED_RATE = float(os.getenv("QUIZ_STUB_MALFORMED_RATE", "0"))
+STUB_SEED = int(os.getenv("QUIZ_STUB_SEED", "0"))
+
+
+class StubBackend(LLMBackend):
+    """LLM backend answering from a FakeGenerativeModel (QUIZ_LLM_BACKEND=stub)."""
+    name = "stub"
+
+    def __init__(self, model: FakeGenerativeModel | None = None):
+        self.model = model or FakeGenerativeModel(latency=STUB_LATENCY, malformed_rate=STUB_MALFORMED_RATE, seed=STUB_SEED)
+
+    def generate(self, prompt: str, question_type: str) -> str:
+        return self.model.generate_content(prompt).text
+
+    def stream(self, prompt: str, question_type: str) -> Iterator[str]:
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+    async def generate_async(self, prompt: str, question_type: str) -> str:
+        return (await self.model.generate_content_async(prompt)).text
+
+
+def use_fake_llm(coalesce: bool | None = None, scheduler: LLMScheduler | None = None, **kwargs) -> FakeGenerativeModel:
+    """
+    Routes all question generation in this process through a FakeGenerativeModel.
+
+    Keyword arguments are passed to FakeGenerativeModel; `coalesce` overrides
+    QUIZ_LLM_COALESCE for the generator, and `scheduler` rate limits the fake
+    like a metered backend.
+    """
+    model = FakeGenerativeModel(**kwargs)
+    generator_kwargs = {} if coalesce is None else {"coalesce": coalesce}
+    if scheduler is not None:
+        generator_kwargs["scheduler"] = scheduler
+    set_generator(QuizQuestionGenerator(backend=StubBackend(model), **generator_kwargs))
+    return model
@@ -0,0 +1,252 @@
+"""
+Grading engine for quiz answers, independent of Flask.
+
+Each question is compiled once into an `AnswerIndex` (cached per question id),
+and `grade` returns a structured `GradeResult`; turning that into feedback HTML
+is the rendering engine's job (see rendering_engine.render_feedback).
+
+Bulk re-scoring from the command line:
+
+    python -m app.grader answers.jsonl [--questions questions.jsonl] [--output results.jsonl]
+
+Every line of answers.jsonl is {"question": {...} or "question_id": "...",
+"submission": {"answer": "..."} or {"dad_answers": {...}}}. Questions referenced
+by id are looked up in the --questions JSONL file.
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator
+
+from pydantic import ValidationError
+
+from .question_models import AnyQuizQuestionModel, question_from_dict
+
+logger = logging.getLogger(__name__)
+
+ANSWER_INDEX_CACHE_SIZE = 4096
+
+# Per-item outcomes for drag-and-drop questions
+ITEM_CORRECT = "correct"
+ITEM_INCORRECT = "incorrect"
+ITEM_MISSED = "missed"
+ITEM_DISTRACTOR = "distractor"  # An item with no correct target that the user placed anyway
+
+
+@dataclass(frozen=True)
+class AnswerIndex:
+    """The answer key of one question, precompiled for repeated grading."""
+    question_id: str
+    question_type: str
+    correct_answer: str | None = None                 # MCQ
+    correct_matches: tuple[tuple[str, str], ...] = ()  # DAD, in draggable_items order
+    distractors: tuple[str, ...] = ()                  # DAD items without a correct target
+    explanation: str | None = None
+
+
+@dataclass(frozen=True)
+class ItemResult:
+    item: str
+    status: str
+    placed_on: str | None
+    expected: str | None
+
+
+@dataclass(frozen=True)
+class GradeResult:
+    question_id: str
+    question_type: str
+    is_correct: bool
+    num_correct: int
+    num_total: int
+    selected_answer: str | None = None
+    correct_answer: str | None = None
+    items: tuple[ItemResult, ...] = ()
+    explanation: str | None = None
+    error: str | None = None  # "missing_answer_key" or "unsupported_type"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def compile_answer_index(question: AnyQuizQuestionModel) -> AnswerIndex:
+    """Builds the answer index for a question object."""
+    if question.question_type == "MCQ":
+        return AnswerIndex(question.id, "MCQ",
+                           correct_answer=question.correct_answer,
+                           explanation=question.explanation)
+    if question.question_type == "DAD":
+        correct_matches = question.correct_matches
+        return AnswerIndex(
+            question.id, "DAD",
+            correct_matches=tuple((item, correct_matches[item]) for item in question.draggable_items if correct_matches.get(item)),
+            distractors=tuple(item for item in question.draggable_items if not correct_matches.get(item)),
+            explanation=question.explanation,
+        )
+    return AnswerIndex(question.id, str(question.question_type))
+
+
+_index_cache: OrderedDict[tuple[str, str], AnswerIndex] = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def get_answer_index(question: AnyQuizQuestionModel) -> AnswerIndex:
+    """Returns the cached answer index for the question's id, compiling it on first use."""
+    if not question.id:
+        return compile_answer_index(question)
+    # The question text is part of the key because generated ids are not guaranteed unique.
+    key = (question.id, question.question_text)
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = compile_answer_index(question)
+    with _index_cache_lock:
+        _index_cache[key] = index
+        if len(_index_cache) > ANSWER_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def clear_answer_index_cache() -> None:
+    with _index_cache_lock:
+        _index_cache.clear()
+
+
+def grade_with_index(index: AnswerIndex, submission: dict) -> GradeResult:
+    """
+    Grades a submission against a precompiled answer index.
+
+    Args:
+        index: The question's answer index.
+        submission: {"answer": "..."} for MCQ, {"dad_answers": {item: target}} for DAD.
+    """
+    if index.question_type == "MCQ":
+        selected_answer = submission.get('answer')
+        is_correct = selected_answer is not None and selected_answer == index.correct_answer
+        return GradeResult(index.question_id, "MCQ", is_correct, int(is_correct), 1,
+                           selected_answer=selected_answer, correct_answer=index.correct_answer,
+                           explanation=index.explanation)
+
+    if index.question_type == "DAD":
+        if not index.correct_matches:
+            return GradeResult(index.question_id, "DAD", False, 0, 0, error="missing_answer_key")
+        user_matches = submission.get('dad_answers') or {}
+
+        items = []
+        num_correct = 0
+        for item, correct_target in index.correct_matches:
+            user_target = user_matches.get(item)
+            if user_target == correct_target:
+                num_correct += 1
+                items.append(ItemResult(item, ITEM_CORRECT, user_target, correct_target))
+            elif user_target:
+                items.append(ItemResult(item, ITEM_INCORRECT, user_target, correct_target))
+            else:
+                items.append(ItemResult(item, ITEM_MISSED, None, correct_target))
+        for item in index.distractors:
+            # Unplaced distractors are implicitly correct and get no entry.
+            if user_matches.get(item):
+                items.append(ItemResult(item, ITEM_DISTRACTOR, user_matches[item], None))
+
+        num_total = len(index.correct_matches)
+        return GradeResult(index.question_id, "DAD", num_correct == num_total, num_correct, num_total,
+                           items=tuple(items), explanation=index.explanation)
+
+    return GradeResult(index.question_id, index.question_type, False, 0, 0, error="unsupported_type")
+
+
+def grade(question: AnyQuizQuestionModel, submission: dict) -> GradeResult:
+    """Grades one submission for a question object."""
+    return grade_with_index(get_answer_index(question), submission)
+
+
+# --- Bulk grading ---
+
+def grade_bulk(records: Iterable[dict], questions_by_id: dict[str, dict] | None = None) -> Iterator[GradeResult]:
+    """
+    Grades many (question, submission) records in one pass.
+
+    Question dictionaries are validated into question objects, and each
+    answer index is compiled once per question for the whole run. Records
+    that are not objects, or whose question cannot be found or is invalid,
+    are skipped with a warning.
+    """
+    # Keyed like get_answer_index: ids alone are not unique (e.g. in logs from
+    # before ids were derived from the question content).
+    indexes: dict[tuple[str, str], AnswerIndex] = {}
+    questions_by_id = questions_by_id or {}
+    for line_number, record in enumerate(records, start=1):
+        if not isinstance(record, dict):
+            logger.warning(f"Record {line_number}: expected a JSON object, got {type(record).__name__}; skipped.")
+            continue
+        question_data = record.get('question') or questions_by_id.get(record.get('question_id'))
+        if not question_data:
+            logger.warning(f"Record {line_number}: question '{record.get('question_id')}' not found; skipped.")
+            continue
+        if not isinstance(question_data, dict):
+            logger.warning(f"Record {line_number}: question is a {type(question_data).__name__}, not an object; skipped.")
+            continue
+        question_id = str(question_data.get('id', ''))
+        key = (question_id, str(question_data.get('question_text', '')))
+        index = indexes.get(key)
+        if index is None:
+            try:
+                question = question_from_dict(question_data)
+            except ValidationError as e:
+                logger.warning(f"Record {line_number}: question '{question_id}' is invalid ({e.error_count()} errors); skipped.")
+                continue
+            index = indexes[key] = compile_answer_index(question)
+        yield grade_with_index(index, record.get('submission') or {})
+
+
+def _read_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"{path}:{line_number}: invalid JSON ({e}); skipped.")
+                continue
+            if not isinstance(record, dict):
+                logger.warning(f"{path}:{line_number}: expected a JSON object, got {type(record).__name__}; skipped.")
+                continue
+            yield record
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-score quiz answers from a JSONL log.")
+    parser.add_argument("answers", help="JSONL file of {question|question_id, submission} records")
+    parser.add_argument("--questions", help="JSONL file of question dictionaries, for records that only carry question_id")
+    parser.add_argument("--output", help="Write one JSON grade result per line to this file")
+    args = parser.parse_args(argv)
+
+    questions_by_id = {q['id']: q for q in _read_jsonl(args.questions) if 'id' in q} if args.questions else {}
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+
+    graded = correct = 0
+    try:
+        for result in grade_bulk(_read_jsonl(args.answers), questions_by_id):
+            graded += 1
+            correct += result.is_correct
+            if output:
+                output.write(json.dumps(result.to_dict()) + "\n")
+    finally:
+        if output:
+            output.close()
+
+    print(f"Graded {graded} answers: {correct} correct ({(correct / graded if graded else 0):.1%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Cheap local repairs for LLM question responses that fail validation.
+
+Applied only after the fast path (fence strip + union validate_json) has
+failed, so well-formed responses never pay for it. Two layers:
+
+- `repair_json_text`: code fences anywhere, prose around the JSON value and
+  trailing commas.
+- `repair_question_fields`: answer keys that differ from the options they
+  refer to only by case, whitespace or a few characters.
+"""
+import difflib
+import re
+
+_FENCE = re.compile(r"```[a-zA-Z]*[ \t]*\r?\n?(.*?)```", re.DOTALL)
+_OPENERS = {"{": "}", "[": "]"}
+
+# difflib ratio above which a key is considered a typo of a draggable item / drop target
+FUZZY_MATCH_CUTOFF = 0.85
+
+
+def _fenced_block(text: str) -> str:
+    """The content of the first code fence that contains JSON, or the text unchanged."""
+    for match in _FENCE.finditer(text):
+        block = match.group(1).strip()
+        if block[:1] in _OPENERS:
+            return block
+    if text.lstrip().startswith("```"):
+        # Unterminated opening fence (e.g. a truncated response): drop the fence line.
+        return text.lstrip().split("\n", 1)[-1]
+    return text
+
+
+def _outermost_value(text: str) -> str:
+    """The first top-level JSON object or array in the text, ignoring anything around it."""
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return text
+    stack = []
+    in_string = escaped = False
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _OPENERS:
+            stack.append(_OPENERS[char])
+        elif char in "}]":
+            if stack and stack[-1] == char:
+                stack.pop()
+            if not stack:
+                return text[start:pos + 1]
+    return text[start:]  # Unbalanced; let the decoder report it
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """Drops commas that directly precede a closing brace or bracket (outside strings)."""
+    out = []
+    in_string = escaped = False
+    pending_comma = None  # Index in `out` of a comma that may turn out to be trailing
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            out.append(char)
+            continue
+        if char in "}]" and pending_comma is not None:
+            del out[pending_comma]
+            pending_comma = None
+        elif char == ",":
+            pending_comma = len(out)
+        elif not char.isspace():
+            pending_comma = None
+        if char == '"':
+            in_string = True
+        out.append(char)
+    return "".join(out)
+
+
+def repair_json_text(text: str) -> str:
+    """
+    Extracts the JSON value from an LLM response and fixes common syntax slips.
+
+    Returns:
+        Text that is more likely to decode; it is not guaranteed to be valid JSON.
+    """
+    return _remove_trailing_commas(_outermost_value(_fenced_block(text)))
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+
+def _closest(value: str, candidates: list[str]) -> str | None:
+    """The candidate equal to `value` up to case/whitespace, else its single close typo match."""
+    if value in candidates:
+        return value
+    normalized = _normalize(value)
+    exact = [c for c in candidates if _normalize(c) == normalized]
+    if len(exact) == 1:
+        return exact[0]
+    by_normalized = {_normalize(c): c for c in candidates}
+    close = difflib.get_close_matches(normalized, list(by_normalized), n=2, cutoff=FUZZY_MATCH_CUTOFF)
+    if len(close) == 1:
+        return by_normalized[close[0]]
+    return None
+
+
+def repair_question_fields(data: dict, question_type: str) -> dict:
+    """
+    Snaps answer keys onto the values they refer to.
+
+    MCQ: `correct_answer` is replaced by the option it matches up to case and
+    whitespace. DAD: `correct_matches` keys and targets are replaced by the
+    draggable item / drop target they match up to case, whitespace or a small
+    typo, provided the match is unambiguous and not already taken. Anything
+    that cannot be matched is left for validation to reject.
+    """
+    if question_type == "MCQ":
+        options = data.get('options')
+        answer = data.get('correct_answer')
+        if isinstance(options, list) and isinstance(answer, str) and answer not in options:
+            normalized = _normalize(answer)
+            matches = [o for o in options if isinstance(o, str) and _normalize(o) == normalized]
+            if len(matches) == 1:
+                data['correct_answer'] = matches[0]
+
+    elif question_type == "DAD":
+        items = [i for i in data.get('draggable_items') or [] if isinstance(i, str)]
+        targets = [t for t in data.get('drop_targets') or [] if isinstance(t, str)]
+        matches = data.get('correct_matches')
+        if isinstance(matches, dict) and items:
+            repaired: dict = {}
+            for key, target in matches.items():
+                fixed_key = _closest(key, items) if isinstance(key, str) else None
+                if fixed_key is None or fixed_key in repaired:
+                    fixed_key = key  # Leave it for validation to report
+                if isinstance(target, str) and targets:
+                    target = _closest(target, targets) or target
+                repaired[fixed_key] = target
+            data['correct_matches'] = repaired
+
+    return data
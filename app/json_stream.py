@@ -0,0 +1,78 @@
+import json
+
+
+class IncrementalJSONObjectParser:
+    """
+    Extracts top-level fields of a JSON object while it is still being streamed.
+
+    Text is fed in arbitrary chunks. Whenever a top-level member ("key": value)
+    is complete, it is decoded and returned from `feed`, so callers can use
+    e.g. 'question_text' long before the closing brace arrives. Anything
+    before the opening brace (such as a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start: int | None = None
+        self.fields: dict = {}
+        self.complete = False
+
+    def feed(self, chunk: str) -> dict:
+        """
+        Adds a chunk of text.
+
+        Returns:
+            The top-level fields completed by this chunk (possibly empty).
+        """
+        self._buffer += chunk
+        completed: dict = {}
+        buffer = self._buffer
+        pos = self._pos
+
+        while pos < len(buffer) and not self.complete:
+            char = buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = pos + 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._finish_member(buffer[self._member_start:pos], completed)
+                    self.complete = True
+                self._depth = max(self._depth - 1, 0)
+            elif char == "," and self._depth == 1:
+                self._finish_member(buffer[self._member_start:pos], completed)
+                self._member_start = pos + 1
+            pos += 1
+
+        self._pos = pos
+        return completed
+
+    def _finish_member(self, member_text: str, completed: dict) -> None:
+        if not member_text.strip():
+            return
+        try:
+            member = json.loads("{" + member_text + "}")
+        except json.JSONDecodeError:
+            return  # Malformed member; final validation will report it
+        completed.update(member)
+        self.fields.update(member)
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return self._buffer
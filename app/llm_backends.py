@@ -0,0 +1,252 @@
+"""
+LLM backends behind QuizQuestionGenerator.
+
+A backend turns a rendered prompt into raw response text; prompt building,
+validation and fallbacks stay in llm_integration. Available backends:
+
+- "gemini": Google Gemini through google.generativeai (the default).
+- "stub": the deterministic local fake from fake_llm, for development and benchmarks.
+- "replay": answers from a JSONL file recorded earlier with QUIZ_LLM_RECORD_PATH.
+
+Select one with QUIZ_LLM_BACKEND.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+LLM_BACKEND = os.getenv("QUIZ_LLM_BACKEND", "gemini")  # "gemini", "stub" or "replay"
+GEMINI_MODEL_NAME = os.getenv("QUIZ_GEMINI_MODEL", "gemini-1.5-flash-latest")
+LLM_REPLAY_PATH = os.getenv("QUIZ_LLM_REPLAY_PATH", "llm_replay.jsonl")
+LLM_RECORD_PATH = os.getenv("QUIZ_LLM_RECORD_PATH", "")  # When set, every response is appended here for later replay
+
+
+def import_genai():
+    """
+    Imports the Gemini SDK on first use. It pulls in grpc and protobuf and is
+    most of the process's import time, so processes that never call Gemini
+    (stub or replay backends, tooling) don't pay for it.
+    """
+    import google.generativeai as genai
+    return genai
+
+
+def prompt_hash(prompt: str) -> str:
+    """Stable key for a prompt in replay files."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:24]
+
+
+class LLMBackend:
+    """
+    Interface every backend implements.
+
+    `question_type` is "MCQ", "DAD" or "BATCH"; backends may ignore it, the
+    replay backend uses it to pick a recording when the exact prompt is unknown.
+    Errors are raised as exceptions; the generator turns them into fallbacks.
+    """
+    name = "base"
+    unavailable_label = "Backend Unavailable"  # Shown on the fallback question when is_available() is False
+    metered = False  # True when calls spend a provider quota; such backends are rate limited by default
+
+    def is_available(self) -> bool:
+        """False when the backend cannot run at all (e.g. no API key); callers serve a fallback."""
+        return True
+
+    def warm_up(self) -> None:
+        """Does expensive one-time setup ahead of the first call (e.g. in a preloading parent process)."""
+
+    def generate(self, prompt: str, question_type: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, question_type: str) -> Iterator[str]:
+        """Yields the response in chunks. Backends without native streaming yield it whole."""
+        yield self.generate(prompt, question_type)
+
+    async def generate_async(self, prompt: str, question_type: str) -> str:
+        return await asyncio.to_thread(self.generate, prompt, question_type)
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Google Gemini. `genai.configure` runs once, and again only if GOOGLE_API_KEY
+    changes; the model client and generation config are shared by all calls.
+    """
+    name = "gemini"
+    unavailable_label = "API Key Missing"
+    metered = True
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME):
+        self.model_name = model_name
+        self._client_lock = threading.Lock()
+        self._api_key: str | None = None
+        self._model = None
+        self._generation_config = None
+
+    def is_available(self) -> bool:
+        return bool(os.getenv("GOOGLE_API_KEY"))
+
+    def get_model(self):
+        """Returns the shared model client, configuring the SDK on first use or key change."""
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("GOOGLE_API_KEY is not set.")
+        if self._model is not None and api_key == self._api_key:
+            return self._model
+        with self._client_lock:
+            if self._model is None or api_key != self._api_key:
+                genai = import_genai()
+                genai.configure(api_key=api_key)
+                self._generation_config = genai.types.GenerationConfig(
+                    response_mime_type="application/json",
+                    # response_schema argument is not directly supported for Pydantic models in generate_content's GenerationConfig.
+                    # The schema must be part of the textual prompt.
+                )
+                self._model = genai.GenerativeModel(model_name=self.model_name)
+                self._api_key = api_key
+                logger.info(f"Configured Gemini client for model '{self.model_name}'.")
+        return self._model
+
+    def warm_up(self) -> None:
+        # Only the import: clients hold grpc channels, which must not be shared with forked workers.
+        import_genai()
+
+    def generate(self, prompt: str, question_type: str) -> str:
+        response = self.get_model().generate_content(prompt, generation_config=self._generation_config)
+        return self._response_text(response)
+
+    def stream(self, prompt: str, question_type: str) -> Iterator[str]:
+        response = self.get_model().generate_content(prompt, generation_config=self._generation_config, stream=True)
+        for chunk in response:
+            yield chunk.text or ""
+
+    async def generate_async(self, prompt: str, question_type: str) -> str:
+        model = self.get_model()
+        response = await model.generate_content_async(prompt, generation_config=self._generation_config)
+        return self._response_text(response)
+
+    @staticmethod
+    def _response_text(response) -> str:
+        try:
+            return response.text or ""
+        except ValueError:
+            # .text raises when the response was blocked; the prompt feedback says why.
+            logger.error(f"LLM prompt feedback: {getattr(response, 'prompt_feedback', None)}")
+            raise
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Answers from a JSONL file of {"prompt_hash", "question_type", "response"} records.
+
+    A prompt recorded verbatim gets its recorded response. Any other prompt
+    gets the recorded responses of the same question_type in rotation, so a
+    small recording can drive any topic (the generator re-labels the topic).
+    """
+    name = "replay"
+
+    def __init__(self, path: str = LLM_REPLAY_PATH):
+        self.path = path
+        self._by_prompt: dict[str, str] = {}
+        self._by_type: dict[str, list[str]] = {}
+        self._next_index: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            logger.warning(f"Replay file '{self.path}' not found; the replay backend has no responses.")
+            return
+        with open(self.path, encoding="utf-8") as handle:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    response = record['response']
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    logger.warning(f"{self.path}:{line_number}: not a replay record; skipped.")
+                    continue
+                if record.get('prompt_hash'):
+                    self._by_prompt[record['prompt_hash']] = response
+                self._by_type.setdefault(str(record.get('question_type', '')).upper(), []).append(response)
+        logger.info(f"Loaded {sum(len(r) for r in self._by_type.values())} replay responses from '{self.path}'.")
+
+    def is_available(self) -> bool:
+        return bool(self._by_type)
+
+    def generate(self, prompt: str, question_type: str) -> str:
+        recorded = self._by_prompt.get(prompt_hash(prompt))
+        if recorded is not None:
+            return recorded
+        responses = self._by_type.get(question_type)
+        if not responses:
+            raise LookupError(f"No recorded {question_type} responses in '{self.path}'.")
+        with self._lock:
+            index = self._next_index.get(question_type, 0)
+            self._next_index[question_type] = index + 1
+        return responses[index % len(responses)]
+
+    async def generate_async(self, prompt: str, question_type: str) -> str:
+        return self.generate(prompt, question_type)  # No I/O; not worth a thread hop
+
+
+class RecordingBackend(LLMBackend):
+    """Wraps another backend and appends every successful response to a replay file."""
+
+    def __init__(self, inner: LLMBackend, path: str = LLM_RECORD_PATH):
+        self.inner = inner
+        self.name = f"{inner.name}+record"
+        self.unavailable_label = inner.unavailable_label
+        self.metered = inner.metered
+        self.path = path
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return self.inner.is_available()
+
+    def warm_up(self) -> None:
+        self.inner.warm_up()
+
+    def _record(self, prompt: str, question_type: str, response: str) -> None:
+        record = {"prompt_hash": prompt_hash(prompt), "question_type": question_type, "response": response}
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+
+    def generate(self, prompt: str, question_type: str) -> str:
+        response = self.inner.generate(prompt, question_type)
+        self._record(prompt, question_type, response)
+        return response
+
+    def stream(self, prompt: str, question_type: str) -> Iterator[str]:
+        chunks = []
+        for chunk in self.inner.stream(prompt, question_type):
+            chunks.append(chunk)
+            yield chunk
+        self._record(prompt, question_type, "".join(chunks))
+
+    async def generate_async(self, prompt: str, question_type: str) -> str:
+        response = await self.inner.generate_async(prompt, question_type)
+        self._record(prompt, question_type, response)
+        return response
+
+
+def create_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    """Builds the configured backend ("gemini", "stub" or "replay"), recording it if QUIZ_LLM_RECORD_PATH is set."""
+    if name == "stub":
+        from .fake_llm import StubBackend
+        backend: LLMBackend = StubBackend()
+    elif name == "replay":
+        backend = ReplayBackend()
+    else:
+        if name != "gemini":
+            logger.warning(f"Unknown LLM backend '{name}'. Using Gemini.")
+        backend = GeminiBackend()
+    if LLM_RECORD_PATH:
+        backend = RecordingBackend(backend)
+    return backend
@@ -0,0 +1,342 @@
+"""
+Quota scheduler for LLM calls.
+
+Every backend call first takes a ticket from an LLMScheduler. Two token
+buckets refill continuously: one for requests per minute and one for
+estimated tokens per minute. When a bucket is short, callers wait in a
+queue ordered by priority class, so a user waiting on a page
+(INTERACTIVE) goes ahead of background prefetch (PREFETCH) and offline
+bank building (BULK).
+
+Admission control keeps the queue from turning into latency. When the wait
+a call can expect exceeds its class's limit (or its deadline), the call is
+rejected with AdmissionRejected right away. The caller then serves a banked
+question or a fallback instead of waiting.
+
+Callers set their class for a block of work with `llm_priority`:
+
+    with llm_priority(Priority.PREFETCH):
+        generate_quiz_questions(topic, 5)
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Callable, Iterator
+
+from .metrics import LLM_QUEUE_SECONDS, LLM_SCHEDULER_ADMISSIONS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("QUIZ_LLM_RPM", "60"))  # 0 disables the request bucket
+LLM_TOKENS_PER_MINUTE = float(os.getenv("QUIZ_LLM_TPM", "1000000"))  # 0 disables the token bucket
+LLM_BURST_SECONDS = float(os.getenv("QUIZ_LLM_BURST_SECONDS", "10"))  # Bucket capacity, in seconds of refill
+LLM_RESPONSE_TOKENS_ESTIMATE = int(os.getenv("QUIZ_LLM_RESPONSE_TOKENS", "300"))  # Expected output tokens per question
+CHARS_PER_TOKEN = 4
+
+
+class Priority(IntEnum):
+    """Scheduling classes; lower values are served first."""
+    INTERACTIVE = 0  # A user is waiting on the response
+    PREFETCH = 1     # Background refills of the prefetch pool
+    BULK = 2         # Offline work such as the bank builder
+
+
+# Longest queue wait each class accepts before it is turned away (0 for no limit).
+MAX_QUEUE_WAIT = {
+    Priority.INTERACTIVE: float(os.getenv("QUIZ_LLM_MAX_QUEUE_WAIT", "2")),
+    Priority.PREFETCH: float(os.getenv("QUIZ_LLM_PREFETCH_MAX_QUEUE_WAIT", "30")),
+    Priority.BULK: float(os.getenv("QUIZ_LLM_BULK_MAX_QUEUE_WAIT", "0")),
+}
+
+_priority: ContextVar[Priority] = ContextVar("quiz_llm_priority", default=Priority.INTERACTIVE)
+
+
+def current_priority() -> Priority:
+    """The priority class LLM calls made from this context are scheduled under."""
+    return _priority.get()
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Schedules LLM calls made inside the block under `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(prompt: str, questions: int = 1, response_text: str | None = None) -> int:
+    """
+    Rough token count of a call: prompt plus response at ~4 characters per
+    token. Before the call the response is estimated per question; after
+    it, pass `response_text` for the actual size.
+    """
+    if response_text is None:
+        response_tokens = questions * LLM_RESPONSE_TOKENS_ESTIMATE
+    else:
+        response_tokens = len(response_text) // CHARS_PER_TOKEN
+    return len(prompt) // CHARS_PER_TOKEN + response_tokens + 1
+
+
+class AdmissionRejected(Exception):
+    """The call could not start within its priority class's queue-wait limit."""
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` units per second, up to `burst_seconds`
+    worth. A rate of 0 disables it. Not thread-safe; LLMScheduler holds
+    the lock around every use.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = LLM_BURST_SECONDS):
+        self.rate = max(per_minute, 0) / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0) if self.rate else math.inf
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def refill(self, now: float) -> None:
+        if self.enabled:
+            self.level = min(self.level + (now - self._updated) * self.rate, self.capacity)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (after `refill`)."""
+        if not self.enabled or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        if self.enabled:
+            self.level -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Charges `delta` more units (or refunds them when negative), e.g. once actual usage is known."""
+        if self.enabled:
+            self.level = min(self.level - delta, self.capacity)
+
+
+@dataclass(frozen=True)
+class Ticket:
+    """Permission for one backend call."""
+    priority: Priority
+    tokens: int             # Tokens charged up front (the estimate)
+    queued_seconds: float   # Time spent waiting in the queue
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: float = field(compare=False)
+    wake: Callable[[], None] = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+
+
+class LLMScheduler:
+    """
+    Request and token buckets with a priority queue in front of them.
+
+    Sync callers block in `acquire`; coroutines await `acquire_async`. Both
+    raise AdmissionRejected instead of queueing past `max_wait`. Call
+    `settle` with the actual token usage once a response has arrived.
+    """
+
+    def __init__(self,
+                 requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+                 burst_seconds: float = LLM_BURST_SECONDS,
+                 max_wait: dict[Priority, float] | None = None):
+        self._requests = TokenBucket(requests_per_minute, burst_seconds)
+        self._tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_wait = {**MAX_QUEUE_WAIT, **(max_wait or {})}
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests.enabled or self._tokens.enabled
+
+    # --- Acquiring ---
+
+    def acquire(self, tokens: int, priority: Priority | None = None, max_wait: float | None = None) -> Ticket:
+        """
+        Blocks until the call may start.
+
+        Args:
+            tokens: Estimated tokens for the call (see `estimate_tokens`).
+            priority: Scheduling class; defaults to `current_priority()`.
+            max_wait: Longest acceptable queue wait in seconds (0 for no limit);
+                defaults to the class's MAX_QUEUE_WAIT.
+
+        Raises:
+            AdmissionRejected: The call would wait (or has waited) longer than `max_wait`.
+        """
+        priority, max_wait = self._resolve(priority, max_wait)
+        start = time.monotonic()
+        event = threading.Event()
+        entry = self._enter(priority, tokens, max_wait, event.set)
+        if isinstance(entry, Ticket):
+            return entry
+        try:
+            while (timeout := self._poll(entry, start, max_wait)) is not None:
+                event.wait(timeout)
+                event.clear()
+        finally:
+            self._leave(entry)
+        return self._granted(entry, start)
+
+    async def acquire_async(self, tokens: int, priority: Priority | None = None, max_wait: float | None = None) -> Ticket:
+        """Async counterpart of `acquire`; waiting does not block the event loop."""
+        priority, max_wait = self._resolve(priority, max_wait)
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        entry = self._enter(priority, tokens, max_wait, lambda: loop.call_soon_threadsafe(event.set))
+        if isinstance(entry, Ticket):
+            return entry
+        try:
+            while (timeout := self._poll(entry, start, max_wait)) is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            self._leave(entry)
+        return self._granted(entry, start)
+
+    def try_acquire(self, tokens: int, priority: Priority | None = None) -> Ticket | None:
+        """A ticket if the call can start right now without jumping the queue, else None."""
+        priority, _ = self._resolve(priority, None)
+        with self._lock:
+            return self._take_now_locked(priority, tokens, time.monotonic())
+
+    def settle(self, ticket: Ticket, actual_tokens: int) -> None:
+        """Corrects the token bucket for a finished call's actual usage."""
+        with self._lock:
+            self._tokens.adjust(min(actual_tokens, self._tokens.capacity) - ticket.tokens)
+            self._dispatch_locked(time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            return {
+                "queued": len(self._queue),
+                "queued_by_priority": {p.name.lower(): sum(w.priority == p for w in self._queue) for p in Priority},
+                "request_tokens": self._requests.level,
+                "llm_tokens": self._tokens.level,
+            }
+
+    # --- Internals ---
+
+    def _resolve(self, priority: Priority | None, max_wait: float | None) -> tuple[Priority, float]:
+        priority = current_priority() if priority is None else Priority(priority)
+        return priority, self.max_wait[priority] if max_wait is None else max_wait
+
+    def _refill_locked(self, now: float) -> None:
+        self._requests.refill(now)
+        self._tokens.refill(now)
+
+    def _take_now_locked(self, priority: Priority, tokens: float, now: float) -> Ticket | None:
+        tokens = min(tokens, self._tokens.capacity)  # A call bigger than the bucket must still be able to run
+        self._refill_locked(now)
+        if self._queue or self._requests.wait_time(1) or self._tokens.wait_time(tokens):
+            return None
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        LLM_SCHEDULER_ADMISSIONS_TOTAL.inc(priority=priority.name.lower(), outcome="immediate")
+        return Ticket(priority, int(tokens), 0.0)
+
+    def _expected_wait_locked(self, priority: Priority, tokens: float) -> float:
+        """Queue wait for a new call: everything of equal or higher priority goes first."""
+        ahead = [waiter for waiter in self._queue if waiter.priority <= priority]
+        return max(self._requests.wait_time(len(ahead) + 1),
+                   self._tokens.wait_time(sum(waiter.tokens for waiter in ahead) + tokens))
+
+    def _enter(self, priority: Priority, tokens: int, max_wait: float, wake: Callable[[], None]) -> Ticket | _Waiter:
+        """A ticket when the call can start now, else a queued waiter."""
+        if not self.enabled:
+            return Ticket(priority, tokens, 0.0)
+        with self._lock:
+            now = time.monotonic()
+            ticket = self._take_now_locked(priority, tokens, now)
+            if ticket is not None:
+                return ticket
+            tokens = min(tokens, self._tokens.capacity)
+            expected = self._expected_wait_locked(priority, tokens)
+            if max_wait > 0 and expected > max_wait:
+                LLM_SCHEDULER_ADMISSIONS_TOTAL.inc(priority=priority.name.lower(), outcome="rejected")
+                raise AdmissionRejected(f"Expected LLM queue wait {expected:.1f}s exceeds {max_wait:.1f}s for {priority.name.lower()} calls.")
+            waiter = _Waiter(priority, next(self._seq), tokens, wake)
+            heapq.heappush(self._queue, waiter)
+            return waiter
+
+    def _poll(self, waiter: _Waiter, start: float, max_wait: float) -> float | None:
+        """
+        Dispatches what the buckets allow. Returns None once `waiter` holds a
+        ticket, else how long to sleep before polling again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._dispatch_locked(now)
+            if waiter.granted:
+                return None
+            timeout = self._head_wait_locked()
+            if max_wait > 0:
+                remaining = max_wait - (now - start)
+                if remaining <= 0:
+                    LLM_SCHEDULER_ADMISSIONS_TOTAL.inc(priority=Priority(waiter.priority).name.lower(), outcome="timed_out")
+                    raise AdmissionRejected(f"Waited {now - start:.1f}s in the LLM queue without a ticket.")
+                timeout = min(timeout, remaining)
+            return timeout
+
+    def _leave(self, waiter: _Waiter) -> None:
+        """Removes a waiter that gave up (rejected, cancelled or interrupted); no-op once granted."""
+        with self._lock:
+            if waiter.granted or waiter not in self._queue:
+                return
+            self._queue.remove(waiter)
+            heapq.heapify(self._queue)
+            self._dispatch_locked(time.monotonic())  # Those behind it may be able to go now
+
+    def _granted(self, waiter: _Waiter, start: float) -> Ticket:
+        waited = time.monotonic() - start
+        priority = Priority(waiter.priority)
+        LLM_SCHEDULER_ADMISSIONS_TOTAL.inc(priority=priority.name.lower(), outcome="queued")
+        LLM_QUEUE_SECONDS.observe(waited, priority=priority.name.lower())
+        return Ticket(priority, int(waiter.tokens), waited)
+
+    def _head_wait_locked(self) -> float:
+        head = self._queue[0]
+        return max(self._requests.wait_time(1), self._tokens.wait_time(head.tokens), 0.001)
+
+    def _dispatch_locked(self, now: float) -> None:
+        """Grants queued calls in priority order for as long as both buckets allow."""
+        self._refill_locked(now)
+        while self._queue:
+            head = self._queue[0]
+            if self._requests.wait_time(1) or self._tokens.wait_time(head.tokens):
+                break
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(head.tokens)
+            head.granted = True
+            head.wake()
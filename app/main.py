@@ -1,15 +1,145 @@
-from flask import Flask, render_template, request, session, redirect, url_for
-from .llm_integration import generate_quiz_question, DragAndDropQuestion # Added DragAndDropQuestion
-from .rendering_engine import render_quiz_question
+from flask import Flask, Response, g, make_response, render_template, request, session, redirect, url_for, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+from .llm_integration import duplicate_fallback, generate_quiz_question, generate_quiz_question_async, generate_quiz_questions, get_generator, stream_quiz_question, DragAndDropQuestion # Added DragAndDropQuestion
+from .question_models import AnyQuizQuestionModel, question_from_dict
+from .rendering_engine import render_quiz_question, render_feedback, page_etag
+from .grader import GradeResult, grade
+from .answer_log import answer_event, create_answer_log
+from .circuit_breaker import CLOSED
+from . import assets, compression
+from .metrics import ROUTE_SECONDS, ROUTE_STAGE_SECONDS, render_metrics
+from .prefetch import QuestionPrefetchPool
+from .question_bank import QuestionBank
+from .session_store import create_state_store, new_session_id
 import json # Added json import
+import logging
+import os
+import threading
+import time
+from typing import Callable
 
-app = Flask(__name__)
-# It's crucial to set a secret key for session management.
-# In a real application, use a strong, randomly generated key stored securely.
-app.secret_key = 'dev_secret_key_for_quiz_app'
+logger = logging.getLogger(__name__)
 
+# When nothing is ready for a topic, the quiz page streams the question in while
+# the LLM writes it instead of waiting for the complete, validated JSON.
+QUIZ_STREAMING = os.getenv("QUIZ_STREAMING", "1") == "1"
 
-@app.route('/')
+# Ids of the most recent questions a session has been shown; pool and bank reads
+# skip them so long sessions don't see repeats.
+SESSION_SEEN_LIMIT = int(os.getenv("QUIZ_SESSION_SEEN_LIMIT", "200"))
+
+# Free-text topics are resolved to the banked topic they name (see topic_index.py),
+# so "WW2" and "world war 2" share the "World War II" questions and prefetch pool.
+TOPIC_RESOLUTION = os.getenv("QUIZ_TOPIC_RESOLUTION", "1") == "1"
+
+# Only these fields are pushed to the browser before validation; the answer key
+# and explanation stay on the server.
+STREAMED_FIELDS = ('question_type', 'question_text', 'options', 'draggable_items', 'drop_targets')
+
+# Compiled templates are cached on disk (in QUIZ_TEMPLATE_CACHE_DIR, or Jinja's
+# per-user temp directory), so a fresh worker loads bytecode instead of parsing
+# and compiling every template on its first renders.
+TEMPLATE_BYTECODE_CACHE = os.getenv("QUIZ_TEMPLATE_BYTECODE_CACHE", "1") == "1"
+TEMPLATE_CACHE_DIR = os.getenv("QUIZ_TEMPLATE_CACHE_DIR") or None
+
+# With QUIZ_PRELOAD, create_app() warms the process up (see `warm_up`), for
+# servers that fork workers from a preloaded parent (gunicorn --preload).
+QUIZ_PRELOAD = os.getenv("QUIZ_PRELOAD", "0") == "1"
+
+
+# --- Services ---
+
+class QuizServices:
+    """The stores and background workers behind the routes, one set per process."""
+
+    def __init__(self):
+        # Quiz state (topic, current question with its answer key, feedback) lives
+        # server-side; the signed cookie only carries an opaque session id and the
+        # current question id.
+        self.state_store = create_state_store()
+
+        # Validated questions are persisted and reused; the LLM is only called on a miss
+        # or when the bank needs fresh content for a topic.
+        self.question_bank = QuestionBank(generator=generate_quiz_question,
+                                          batch_generator=generate_quiz_questions,
+                                          async_generator=generate_quiz_question_async)
+
+        # Background workers keep a few questions ready per active topic so the request
+        # path only falls back to a blocking generation when the pool is empty. Refills
+        # are requested as one batched LLM call per topic and type.
+        self.prefetch_pool = QuestionPrefetchPool(generator=self.question_bank.get_or_generate,
+                                                  batch_generator=self.question_bank.get_or_generate_many)
+
+        # Graded answers are queued here and written in batches by a background
+        # thread, so analytics never adds a database write to the request path.
+        self.answer_log = create_answer_log()
+
+
+_services: QuizServices | None = None
+_services_pid: int | None = None
+_services_lock = threading.Lock()
+
+
+def services() -> QuizServices:
+    """
+    The process's services, created on first use. A forked worker builds its
+    own rather than sharing the parent's SQLite connections and threads.
+    """
+    global _services, _services_pid
+    if _services is None or _services_pid != os.getpid():
+        with _services_lock:
+            if _services is None or _services_pid != os.getpid():
+                _services = QuizServices()
+                _services_pid = os.getpid()
+    return _services
+
+
+# --- Routes ---
+# Views are collected here and registered on each app by create_app(), under
+# their function names as endpoints (as `app.route` would).
+
+_ROUTES: list[tuple[str, Callable, dict]] = []
+
+
+def _route(rule: str, **options):
+    def decorator(view: Callable) -> Callable:
+        _ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+
+# --- Metrics ---
+
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def _record_request_time(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = str(response.status_code)
+    if response.is_streamed:
+        # Observed once the server closes the response, so the streamed body is included.
+        response.call_on_close(lambda: ROUTE_SECONDS.observe(time.perf_counter() - start, route=route, status=status))
+    else:
+        ROUTE_SECONDS.observe(time.perf_counter() - start, route=route, status=status)
+    return response
+
+
+def _stage(stage: str):
+    """Times a stage of the current route: `with _stage('grade'): ...`."""
+    return ROUTE_STAGE_SECONDS.time(route=request.endpoint or 'unmatched', stage=stage)
+
+
+@_route('/metrics')
+def metrics():
+    """Prometheus text exposition of the per-stage timings and counters (see metrics.py)."""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@_route('/')
 def index():
     """
     Renders the topic selection page.
@@ -17,190 +147,384 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/start_quiz', methods=['POST'])
-def start_quiz():
+def _load_quiz_state() -> dict:
+    """Returns the server-side quiz state for this browser session ({} if none or expired)."""
+    session_id = session.get('sid')
+    state = services().state_store.get(session_id) if session_id else None
+    if state is None:
+        return {}
+    current_question = state.get('current_question')
+    if isinstance(current_question, dict):
+        # Stores that serialize state hand the question back as a dict.
+        current_question = state['current_question'] = question_from_dict(current_question)
+    # qid is None while a streamed question is being generated; the stream stores it.
+    if current_question and session.get('qid') and current_question.id != session.get('qid'):
+        # The cookie points at a different question than the store holds (e.g. a stale tab).
+        return {'current_topic': state.get('current_topic')}
+    return state
+
+
+def _save_quiz_state(state: dict) -> None:
+    """Persists the quiz state and points the cookie at it."""
+    if 'sid' not in session:
+        session['sid'] = new_session_id()
+    current_question = state.get('current_question')
+    session['qid'] = current_question.id if current_question else None
+    services().state_store.set(session['sid'], state)
+
+
+def _mark_seen(state: dict, question_data: AnyQuizQuestionModel) -> None:
+    seen = state.setdefault('seen', [])
+    if question_data.id not in seen:
+        seen.append(question_data.id)
+        del seen[:-SESSION_SEEN_LIMIT]
+
+
+def _record_answer(question: AnyQuizQuestionModel, result: GradeResult) -> None:
+    if result.error is None:
+        services().answer_log.record(answer_event(question, result))
+
+
+def _save_feedback(state: dict, feedback: str) -> None:
+    state['feedback'] = feedback
+    _save_quiz_state(state)
+
+
+async def _next_question(state: dict, topic: str) -> AnyQuizQuestionModel | None:
+    """
+    Puts a new question for the topic into the quiz state and saves the state.
+
+    A prefetched or banked question is used when one is ready. Otherwise,
+    with QUIZ_STREAMING, None is returned and the question is streamed in
+    through /stream_question; without it, the call awaits an async
+    generation. Under WSGI, Flask runs async views with asyncio.run in the
+    worker thread, so the request still holds that thread until the
+    question arrives; the async path only saves the extra executor thread a
+    blocking call would take.
+    """
+    state['current_topic'] = topic # Store the topic for the "Next Question" feature
+    state.pop('feedback', None) # Clear any old feedback
+    seen = set(state.get('seen', ()))
+
+    with _stage('pool'):
+        question_data = services().prefetch_pool.get(topic, exclude_ids=seen)
+    if question_data is None and not QUIZ_STREAMING:
+        with _stage('generate'):
+            question_data = await services().question_bank.get_or_generate_async(topic, exclude_ids=seen)
+    elif question_data is None:
+        with _stage('bank'):
+            question_data = services().question_bank.lookup(topic, exclude_ids=seen)
+            if question_data is None and get_generator().breaker.state != CLOSED:
+                # The stream would only end in the "LLM Unavailable" fallback.
+                question_data = services().question_bank.get(topic, exclude_ids=seen)
+        if question_data is None:
+            state.pop('current_question', None)
+            with _stage('save_state'):
+                _save_quiz_state(state)
+            return None
+
+    state['current_question'] = question_data
+    _mark_seen(state, question_data)
+    with _stage('save_state'):
+        _save_quiz_state(state)
+    return question_data
+
+
+async def _render_new_question(state: dict, topic: str):
+    """Puts a new question for the topic into the quiz state and renders the quiz page (see `_next_question`)."""
+    question_data = await _next_question(state, topic)
+    with _stage('render'):
+        if question_data is None:
+            return render_template('quiz_page.html', stream_url=url_for('stream_question'))
+        question_html = render_quiz_question(question_data)
+        return render_template('quiz_page.html', question_html=question_html)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@_route('/start_quiz', methods=['POST'])
+async def start_quiz():
     """
     Starts a new quiz based on the selected topic.
-    - Gets the topic from the form.
-    - Generates the first question.
-    - Stores question data and topic in session.
-    - Renders the quiz page.
+    - Gets the topic from the form and resolves it to a banked topic.
+    - Takes the first question from the prefetch pool (or generates it).
+    - Stores question data and topic in the server-side quiz state.
+    - Renders the quiz page (or a page that streams the question in).
     """
     if request.method == 'POST':
         topic = request.form.get('topic')
         if not topic:
             # Handle case where topic is missing, though 'required' in HTML should prevent this
             return redirect(url_for('index'))
+        if TOPIC_RESOLUTION:
+            topic = services().question_bank.resolve_topic(topic)
 
-        question_data = generate_quiz_question(topic)
-
-        session['current_question'] = question_data
-        session['current_topic'] = topic # Store the topic for the "Next Question" feature
-        session.pop('feedback', None) # Clear any old feedback
-
-        question_html = render_quiz_question(question_data)
-        return render_template('quiz_page.html', question_html=question_html)
+        # A new quiz starts from scratch, but keeps the session's seen questions.
+        return await _render_new_question({'seen': _load_quiz_state().get('seen', [])}, topic)
 
     # If GET request or other, redirect to index
     return redirect(url_for('index'))
 
 
-@app.route('/submit_answer', methods=['POST'])
+@_route('/submit_answer', methods=['POST'])
 def submit_answer():
     """
     Processes the submitted answer for the current question.
-    - Retrieves current question from session.
-    - Compares submitted answer with the correct answer.
-    - Stores feedback in session.
+    - Retrieves current question from the quiz state.
+    - Grades the submitted answer (see grader.py).
+    - Stores feedback in the quiz state.
     - Redirects to the feedback display page.
     """
-    current_question = session.get('current_question')
+    with _stage('load_state'):
+        state = _load_quiz_state()
+    current_question = state.get('current_question')
     if not current_question:
         return redirect(url_for('index'))
 
     submitted_question_id = request.form.get('question_id')
-    question_type = request.form.get('question_type', current_question.get('question_type')) # Get type from form or session
+    question_type = request.form.get('question_type', current_question.question_type) # Get type from form or quiz state
 
-    if not submitted_question_id or submitted_question_id != current_question.get('id'):
-        session['feedback'] = "There was an issue with the question submission. Please try again."
+    if not submitted_question_id or submitted_question_id != current_question.id:
+        _save_feedback(state, "There was an issue with the question submission. Please try again.")
         return redirect(url_for('index'))
 
-    feedback_message = "No feedback generated."
-
     if question_type == "MCQ":
         selected_answer = request.form.get('answer')
         if not selected_answer:
-            session['feedback'] = "Please select an answer for the MCQ."
+            _save_feedback(state, "Please select an answer for the MCQ.")
             # Redirect to show_feedback, which will re-render the question
             return redirect(url_for('show_feedback'))
-
-        is_correct = (selected_answer == current_question.get('correct_answer'))
-        explanation = current_question.get('explanation', 'No explanation provided.')
-        correct_ans_text = current_question.get('correct_answer', 'N/A')
-
-        if is_correct:
-            feedback_message = f"Correct! {explanation}"
-        else:
-            feedback_message = f"Incorrect. The correct answer was: {correct_ans_text}. Explanation: {explanation}"
+        submission = {'answer': selected_answer}
 
     elif question_type == "DAD":
         user_dad_answers_json = request.form.get('dad_answers')
         try:
             user_matches = json.loads(user_dad_answers_json) if user_dad_answers_json else {}
         except json.JSONDecodeError:
-            user_matches = {}
             logger.error(f"Error decoding DAD answers JSON: {user_dad_answers_json} for question ID {submitted_question_id}")
-            session['feedback'] = "There was an error processing your DAD answers. Please try again."
-            return redirect(url_for('show_feedback'))
-
-        correct_matches = current_question.get('correct_matches', {})
-        if not correct_matches:
-            logger.error(f"No correct_matches found in session for DAD question ID {submitted_question_id}")
-            session['feedback'] = "Could not evaluate DAD question: missing correct answer data."
+            _save_feedback(state, "There was an error processing your DAD answers. Please try again.")
             return redirect(url_for('show_feedback'))
-
-        num_correct = 0
-        num_total_possible = len(correct_matches)
-        feedback_details = []
-
-        # Iterate through all draggable items defined in the question to check their status
-        all_draggable_items = current_question.get('draggable_items', [])
-
-        for item in all_draggable_items:
-            correct_target = correct_matches.get(item) # Target where this item SHOULD be
-            user_target = user_matches.get(item)       # Target where user PLACED this item
-
-            if correct_target: # This item is part of the defined correct matches
-                if user_target == correct_target:
-                    num_correct += 1
-                    feedback_details.append(f"<li>Correct: '{item}' &rarr; '{correct_target}'</li>")
-                elif user_target: # User placed it, but on the wrong target
-                    feedback_details.append(f"<li>Incorrect: '{item}' placed on '{user_target}', should be '{correct_target}'</li>")
-                else: # User did not place this item on any target
-                    feedback_details.append(f"<li>Missed: '{item}' should go to '{correct_target}'</li>")
-            elif user_target: # Item is a distractor and user placed it
-                 feedback_details.append(f"<li>Distractor: '{item}' placed on '{user_target}' (this item had no correct target).</li>")
-            # If an item is a distractor and not placed, it's implicitly correct, so no feedback for it.
-
-        # Refine feedback message
-        if num_total_possible == 0 and not all_draggable_items : # Should not happen with valid questions
-             feedback_message = "This DAD question seems to be empty or misconfigured."
-        elif num_correct == num_total_possible and num_total_possible > 0 :
-            feedback_message = f"Excellent! All {num_total_possible} matches are correct."
-            if feedback_details:
-                 feedback_message += "<ul>" + "".join(feedback_details) + "</ul>"
-        elif num_correct > 0:
-            feedback_message = f"Good effort! You got {num_correct} out of {num_total_possible} primary matches correct."
-            if feedback_details:
-                 feedback_message += "<ul>" + "".join(feedback_details) + "</ul>"
-        else: # num_correct == 0 (and num_total_possible > 0)
-            feedback_message = f"Needs improvement. None of the {num_total_possible} primary matches were correct."
-            if feedback_details:
-                 feedback_message += "<ul>" + "".join(feedback_details) + "</ul>"
-
-        explanation = current_question.get('explanation')
-        if explanation:
-            feedback_message += f"<p><strong>Overall Explanation:</strong> {explanation}</p>"
+        submission = {'dad_answers': user_matches if isinstance(user_matches, dict) else {}}
 
     else:
-        feedback_message = "Unsupported question type encountered during submission."
+        submission = {}
+
+    with _stage('grade'):
+        result = grade(current_question, submission)
+    if result.error == "missing_answer_key":
+        logger.error(f"No correct_matches found in quiz state for DAD question ID {submitted_question_id}")
+    elif result.error == "unsupported_type":
         logger.warning(f"Unsupported question type '{question_type}' for question ID {submitted_question_id}")
+    _record_answer(current_question, result)
 
-    session['feedback'] = feedback_message
+    with _stage('render'):
+        feedback_message = render_feedback(result)
+    with _stage('save_state'):
+        _save_feedback(state, feedback_message)
     return redirect(url_for('show_feedback'))
 
 
-@app.route('/show_feedback')
+@_route('/show_feedback')
 def show_feedback():
     """
     Displays feedback for the submitted answer and the question again.
-    - Retrieves feedback and current question from session.
+    - Retrieves feedback and current question from the quiz state.
     - Renders the quiz page, which will show the feedback.
     """
-    feedback = session.get('feedback') # Don't pop here, let quiz_page display it
-    current_question = session.get('current_question')
+    with _stage('load_state'):
+        state = _load_quiz_state()
+    feedback = state.get('feedback') # Don't pop here, let quiz_page display it
+    current_question = state.get('current_question')
 
     if not current_question: # If there's no question, no point showing feedback page
         return redirect(url_for('index'))
 
-    # We need to re-render the question to display alongside the feedback
-    question_html = render_quiz_question(current_question)
+    # Repeat views of the same question and feedback can be answered with a 304.
+    etag = page_etag(current_question, feedback)
+    if request.if_none_match.contains_weak(etag): # Compressed responses carry the ETag as a weak validator
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
 
+    # The question fragment comes from the render cache when it has been shown before
     # The quiz_page.html template will be responsible for displaying the feedback.
     # And a "Next Question" button.
-    return render_template('quiz_page.html', question_html=question_html, feedback=feedback)
+    with _stage('render'):
+        question_html = render_quiz_question(current_question)
+        response = make_response(render_template('quiz_page.html', question_html=question_html, feedback=feedback))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache' # Always revalidate; the ETag makes that cheap
+    return response
 
 
-@app.route('/next_question')
-def next_question():
+@_route('/next_question')
+async def next_question():
     """
     Loads the next question for the current topic.
-    - Retrieves current topic from session.
-    - Generates a new question.
-    - Updates session with the new question.
-    - Renders the quiz page with the new question.
+    - Retrieves current topic from the quiz state.
+    - Takes a new question from the prefetch pool (or generates it).
+    - Updates the quiz state with the new question.
+    - Renders the quiz page with the new question (or streams it in).
     """
-    current_topic = session.get('current_topic')
+    with _stage('load_state'):
+        state = _load_quiz_state()
+    current_topic = state.get('current_topic')
     if not current_topic:
         # If no topic is stored, redirect to start a new quiz
         return redirect(url_for('index'))
 
-    question_data = generate_quiz_question(current_topic)
-    session['current_question'] = question_data
-    session.pop('feedback', None)  # Clear old feedback before showing a new question
+    return await _render_new_question(state, current_topic)
 
-    question_html = render_quiz_question(question_data)
-    return render_template('quiz_page.html', question_html=question_html)
 
+@_route('/stream_question')
+def stream_question():
+    """
+    Server-sent events for a question that is still being generated.
+    - 'partial' events carry question fields as soon as the LLM completes them.
+    - A single 'final' event carries the validated question's rendered HTML,
+      after the question has been stored in the quiz state and question bank.
+    """
+    with _stage('load_state'):
+        state = _load_quiz_state()
+    session_id = session.get('sid')
+    topic = state.get('current_topic')
+    if not topic or not session_id:
+        return Response(_sse('error', {'message': 'No quiz in progress.'}), mimetype='text/event-stream')
+
+    def events():
+        current_question = state.get('current_question')
+        if current_question: # Already generated, e.g. the browser reconnected
+            yield _sse('final', {'question_id': current_question.id,
+                                 'question_html': render_quiz_question(current_question)})
+            return
+        for kind, payload in stream_quiz_question(topic):
+            if kind == 'partial':
+                visible = {key: value for key, value in payload.items() if key in STREAMED_FIELDS}
+                if visible:
+                    yield _sse('partial', visible)
+            else:
+                with _stage('save_state'):
+                    # Stores the question, or swaps a fallback or near-duplicate for an unseen stored one.
+                    seen = set(state.get('seen', ()))
+                    served = services().question_bank.serve_generated(payload, "ANY", seen)
+                    if served is None:  # A near-duplicate with nothing unseen to serve instead: regenerate once
+                        served = (services().question_bank.serve_generated(generate_quiz_question(topic), "ANY", seen)
+                                  or duplicate_fallback(topic, payload.question_type))
+                    payload = served
+                    state['current_question'] = payload
+                    _mark_seen(state, payload)
+                    services().state_store.set(session_id, state)
+                with _stage('render'):
+                    final = _sse('final', {'question_id': payload.id, 'question_html': render_quiz_question(payload)})
+                yield final
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- JSON API ---
+# The quiz page answers and moves on through these endpoints without reloading:
+# one request grades and returns feedback, one returns the next question's
+# fragment. The form routes above remain for browsers without JavaScript.
+
+def _api_error(message: str, status: int):
+    return {'error': message}, status
+
+
+@_route('/api/quiz/answer', methods=['POST'])
+def api_answer():
+    """
+    Grades an answer for the current question.
 
-if __name__ == '__main__':
-    # Note: Using host='0.0.0.0' makes the app accessible externally if needed.
-    # Port 5001 is used as specified previously.
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    Body: {"question_id": "...", "answer": "..."} for MCQ or
+    {"question_id": "...", "dad_answers": {item: target}} for DAD.
+    Responds with the structured grade result and its feedback HTML.
+    """
+    with _stage('load_state'):
+        state = _load_quiz_state()
+    current_question = state.get('current_question')
+    if not current_question:
+        return _api_error("No quiz in progress.", 404)
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return _api_error("Expected a JSON object.", 400)
+    if payload.get('question_id') != current_question.id:
+        return _api_error("This question is no longer current. Please load the next question.", 409)
+
+    if current_question.question_type == "MCQ":
+        selected_answer = payload.get('answer')
+        if not selected_answer or not isinstance(selected_answer, str):
+            return _api_error("Please select an answer for the MCQ.", 400)
+        submission = {'answer': selected_answer}
+    else:
+        user_matches = payload.get('dad_answers') or {}
+        if not isinstance(user_matches, dict):
+            return _api_error("There was an error processing your DAD answers. Please try again.", 400)
+        submission = {'dad_answers': user_matches}
+
+    with _stage('grade'):
+        result = grade(current_question, submission)
+    if result.error == "missing_answer_key":
+        logger.error(f"No correct_matches found in quiz state for DAD question ID {current_question.id}")
+    _record_answer(current_question, result)
+
+    with _stage('render'):
+        feedback_message = render_feedback(result)
+    with _stage('save_state'):
+        _save_feedback(state, feedback_message) # So a reload of /show_feedback shows the same feedback
+    return {'result': result.to_dict(), 'feedback_html': feedback_message}
+
+
+@_route('/api/quiz/next', methods=['POST'])
+async def api_next_question():
+    """
+    Moves the quiz on to a new question for the current topic.
+
+    Responds with the question's rendered fragment, or with a placeholder
+    fragment and a `stream_url` when the question has to be streamed in.
+    """
+    with _stage('load_state'):
+        state = _load_quiz_state()
+    current_topic = state.get('current_topic')
+    if not current_topic:
+        return _api_error("No quiz in progress.", 404)
+
+    question_data = await _next_question(state, current_topic)
+    with _stage('render'):
+        if question_data is None:
+            return {'stream_url': url_for('stream_question'),
+                    'question_html': render_template('stream_placeholder.html')}
+        return {'question_id': question_data.id,
+                'question_type': question_data.question_type,
+                'question_html': render_quiz_question(question_data)}
+
+
+@_route('/api/quiz/stats')
+def api_question_stats():
+    """
+    Per-question accuracy from the answer log, most answered first.
+
+    Query: topic, question_id and limit (default 100), all optional. With a
+    question_id, the per-item results of a DAD question are included.
+    """
+    question_id = request.args.get('question_id') or None
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return _api_error("limit must be an integer.", 400)
+    answer_log = services().answer_log
+    response = {'questions': answer_log.accuracy(request.args.get('topic') or None, question_id, limit),
+                'log': answer_log.stats()}
+    if question_id:
+        response['items'] = answer_log.item_stats(question_id)
+    return response
 
 
 # Temporary test route for DAD rendering
-@app.route('/test_dad_render')
+@_route('/test_dad_render')
 def test_dad_render():
     sample_dad_question = DragAndDropQuestion(
         id="dad_test_1",
@@ -212,14 +536,86 @@ def test_dad_render():
         correct_matches={"Dog": "Barks", "Cat": "Meows", "Cow": "Moos", "Duck": "Quacks"},
         explanation="These are common sounds made by these animals."
     )
-    question_dict = sample_dad_question.model_dump()
 
     # Render the question using the existing engine
     # The engine will then select 'dad_question.html'
-    question_html = render_quiz_question(question_dict)
+    question_html = render_quiz_question(sample_dad_question)
 
     # For a more complete page view, embed it within quiz_page.html or similar
     # For now, returning raw HTML is fine for quick inspection,
     # but to see it with styles, better to render a full page.
     # return question_html
     return render_template('quiz_page.html', question_html=question_html, feedback="Test DAD Question")
+
+
+# --- App factory ---
+
+def create_app(warm: bool = QUIZ_PRELOAD) -> Flask:
+    """
+    Builds the quiz app.
+
+    Importing this module stays cheap: the LLM SDK is imported on first use
+    and the stores are created per process on first request. With `warm`,
+    the one-time work is done up front instead (see `warm_up`), e.g.
+
+        gunicorn --preload 'app.main:create_app(warm=True)'
+    """
+    # Templates and static files live next to the 'app' package, not inside it.
+    app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    # It's crucial to set a secret key for session management.
+    # In a real application, use a strong, randomly generated key stored securely.
+    app.secret_key = 'dev_secret_key_for_quiz_app'
+    if TEMPLATE_BYTECODE_CACHE:
+        if TEMPLATE_CACHE_DIR:
+            os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+    app.before_request(_start_request_timer)
+    app.after_request(_record_request_time)
+    for rule, view, options in _ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    # Templates link to fingerprinted, precompressed copies of the static files
+    # (see assets.py). Compression is registered after the timing hook so it counts
+    # towards route latency.
+    assets.init_app(app)
+    compression.init_app(app)
+
+    if warm:
+        warm_up(app)
+    return app
+
+
+def warm_up(app: Flask) -> None:
+    """
+    Does the one-time work a worker would otherwise do on its first requests:
+    imports the LLM SDK, builds the generator and its prompt templates, and
+    compiles every template (filling the bytecode cache). No connections or
+    threads are created, so it is safe to run in a parent that forks workers.
+    """
+    start = time.perf_counter()
+    get_generator().backend.warm_up()
+    templates = app.jinja_env.list_templates()
+    for name in templates:
+        app.jinja_env.get_template(name)
+    logger.info(f"Warmed up in {(time.perf_counter() - start) * 1000:.0f} ms ({len(templates)} templates compiled).")
+
+
+_app: Flask | None = None
+
+
+def __getattr__(name: str):
+    # `app.main:app` (flask run, WSGI servers, older scripts) keeps working:
+    # the module-level app is created on first access instead of at import.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == '__main__':
+    # Note: Using host='0.0.0.0' makes the app accessible externally if needed.
+    # Port 5001 is used as specified previously.
+    create_app().run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,286 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain Python objects guarded by a lock, so
+recording a sample costs a dict lookup and a bisect. `render_metrics()`
+produces the text served on /metrics.
+"""
+import bisect
+import threading
+import time
+
+# Latency buckets (seconds) cover both sub-millisecond stages (validation,
+# cached renders) and multi-second LLM calls.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+_registry: list["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def collect(self) -> list[str]:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count per label combination."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(_Metric):
+    """A value that can go up and down per label combination (e.g. a current state)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class _HistogramTimer:
+    """Context manager returned by Histogram.time(); observes the elapsed seconds on exit."""
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: "Histogram", labels: dict[str, str]):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label combination."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label key: [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels: str) -> _HistogramTimer:
+        """`with histogram.time(stage="validate"): ...` records how long the block took."""
+        return _HistogramTimer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            snapshot = sorted((key, (counts[:], total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics() -> None:
+    """Clears every recorded sample (metric definitions stay registered)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        metric.reset()
+
+
+# --- Application metrics ---
+
+LLM_STAGE_SECONDS = Histogram(
+    "quiz_llm_stage_seconds",
+    "Time spent per question generation stage (prompt_build, llm_call, strip_fences, validate, repair, fallback).",
+    ("stage", "question_type"),
+)
+LLM_RESPONSE_BYTES = Histogram(
+    "quiz_llm_response_bytes",
+    "Size of raw LLM responses in bytes.",
+    ("question_type",),
+    buckets=SIZE_BUCKETS,
+)
+FALLBACKS_TOTAL = Counter(
+    "quiz_fallback_questions_total",
+    "Fallback questions served instead of generated ones, by reason (missing_key, validation_error, api_error, deadline_exceeded, quota_exceeded, circuit_open, duplicate).",
+    ("reason", "question_type"),
+)
+LLM_COALESCED_TOTAL = Counter(
+    "quiz_llm_coalesced_total",
+    "Generation requests served by another caller's in-flight LLM call instead of their own, by kind (single, batch).",
+    ("kind",),
+)
+LLM_REPAIRS_TOTAL = Counter(
+    "quiz_llm_repairs_total",
+    "Invalid LLM responses put through local repair, by outcome (repaired, failed).",
+    ("question_type", "outcome"),
+)
+LLM_HEDGES_TOTAL = Counter(
+    "quiz_llm_hedges_total",
+    "Hedged second LLM requests sent after the first was slow, and how many of them answered first (sent, won).",
+    ("outcome",),
+)
+LLM_SCHEDULER_ADMISSIONS_TOTAL = Counter(
+    "quiz_llm_scheduler_admissions_total",
+    "LLM calls by priority class and how the quota scheduler handled them (immediate, queued, rejected, timed_out).",
+    ("priority", "outcome"),
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "quiz_llm_queue_seconds",
+    "Time LLM calls spent queued for quota before starting, by priority class.",
+    ("priority",),
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "quiz_llm_circuit_state",
+    "1 for the LLM circuit breaker's current state (closed, open, half_open), 0 for the others.",
+    ("backend", "state"),
+)
+LLM_CIRCUIT_TRANSITIONS_TOTAL = Counter(
+    "quiz_llm_circuit_transitions_total",
+    "LLM circuit breaker state changes, by the state entered.",
+    ("backend", "state"),
+)
+LLM_CIRCUIT_CALLS_TOTAL = Counter(
+    "quiz_llm_circuit_calls_total",
+    "LLM calls seen by the circuit breaker, by outcome (success, failure, slow, rejected).",
+    ("backend", "outcome"),
+)
+TOPIC_RESOLUTIONS_TOTAL = Counter(
+    "quiz_topic_resolutions_total",
+    "Topics entered by users, by how they were resolved against banked topics (exact, acronym, fuzzy, new).",
+    ("method",),
+)
+ANSWER_EVENTS_TOTAL = Counter(
+    "quiz_answer_events_total",
+    "Answer events by what happened to them (queued, dropped when the queue was full, written, failed to write).",
+    ("outcome",),
+)
+ANSWER_LOG_WRITE_SECONDS = Histogram(
+    "quiz_answer_log_write_seconds",
+    "Time spent writing one batch of answer events.",
+)
+RENDER_SECONDS = Histogram(
+    "quiz_render_seconds",
+    "Time spent rendering a question fragment, by fragment cache outcome.",
+    ("question_type", "cache"),
+)
+ROUTE_SECONDS = Histogram(
+    "quiz_route_seconds",
+    "End-to-end time per route, including streamed bodies.",
+    ("route", "status"),
+)
+ROUTE_STAGE_SECONDS = Histogram(
+    "quiz_route_stage_seconds",
+    "Time spent per stage inside a route (load_state, pool, bank, generate, grade, render, save_state).",
+    ("route", "stage"),
+)
@@ -0,0 +1,238 @@
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Collection
+
+from .llm_integration import AnyQuizQuestionModel, generate_quiz_question, is_fallback_question, normalize_topic
+from .llm_scheduler import Priority, llm_priority
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+PREFETCH_POOL_DEPTH = int(os.getenv("QUIZ_PREFETCH_DEPTH", "3"))          # Questions kept ready per topic and type
+PREFETCH_LOW_WATERMARK = int(os.getenv("QUIZ_PREFETCH_LOW_WATERMARK", "1"))  # Refill once a pool drops to this size
+PREFETCH_WORKERS = int(os.getenv("QUIZ_PREFETCH_WORKERS", "2"))
+PREFETCH_IDLE_TOPIC_TTL = float(os.getenv("QUIZ_PREFETCH_IDLE_TTL", "900"))  # Seconds before an unused topic is dropped
+
+QUESTION_TYPES = ("MCQ", "DAD")
+
+
+class _TopicPool:
+    """Ready questions for one topic, split by question type."""
+
+    def __init__(self, topic: str):
+        self.topic = topic  # Original spelling, passed to the generator
+        self.ready: dict[str, deque] = {qtype: deque() for qtype in QUESTION_TYPES}
+        self.pending: dict[str, int] = {qtype: 0 for qtype in QUESTION_TYPES}
+        self.last_access = time.monotonic()
+
+
+class QuestionPrefetchPool:
+    """
+    Keeps a small number of validated questions ready for every active topic.
+
+    Background worker threads generate questions ahead of time so the request
+    path only has to pop one from a deque. When a topic's pool for a type drops
+    to the low watermark, refills are queued for the workers (as one batch per
+    topic and type when a `batch_generator` is given). Topics that have
+    not been requested for `idle_ttl` seconds are evicted.
+    """
+
+    def __init__(self,
+                 generator: Callable[[str, str], AnyQuizQuestionModel] = generate_quiz_question,
+                 batch_generator: Callable[[str, int, str], list[AnyQuizQuestionModel]] | None = None,
+                 depth: int = PREFETCH_POOL_DEPTH,
+                 low_watermark: int = PREFETCH_LOW_WATERMARK,
+                 workers: int = PREFETCH_WORKERS,
+                 idle_ttl: float = PREFETCH_IDLE_TOPIC_TTL):
+        self.generator = generator
+        self.batch_generator = batch_generator  # When set, a refill of N questions is a single call
+        self.depth = max(depth, 0)
+        self.low_watermark = min(max(low_watermark, 0), self.depth)
+        self.num_workers = max(workers, 0)
+        self.idle_ttl = idle_ttl
+
+        self._pools: dict[str, _TopicPool] = {}
+        self._lock = threading.Lock()
+        self._tasks: queue.Queue = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._last_eviction = time.monotonic()
+
+    # --- Lifecycle ---
+
+    def start(self) -> None:
+        """Starts the worker threads. Called lazily on first use."""
+        with self._lock:
+            if self._threads or self.num_workers == 0 or self.depth == 0:
+                return
+            self._stopping.clear()
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"quiz-prefetch-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {self.num_workers} prefetch workers (depth={self.depth}, low watermark={self.low_watermark}).")
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        """Signals the workers to exit and waits for them."""
+        self._stopping.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._tasks.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    # --- Request path ---
+
+    def get(self, topic: str, preferred_type: str = "ANY", exclude_ids: Collection[str] = ()) -> AnyQuizQuestionModel | None:
+        """
+        Pops a ready question for the topic without blocking.
+
+        Args:
+            topic: The quiz topic as entered by the user.
+            preferred_type: "MCQ", "DAD" or "ANY".
+            exclude_ids: Ids the caller must not get (e.g. already seen in the
+                session); such questions stay pooled for other callers.
+
+        Returns:
+            A question object, or None if nothing is ready yet. Either way
+            the topic is marked active and refills are scheduled.
+        """
+        self.start()
+        self._maybe_evict_idle()
+
+        key = normalize_topic(topic)
+        preferred_type = preferred_type.upper()
+        if preferred_type in QUESTION_TYPES:
+            type_order = [preferred_type]
+        else:
+            type_order = random.sample(QUESTION_TYPES, len(QUESTION_TYPES))
+
+        question_data = None
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = _TopicPool(topic)
+            pool.last_access = time.monotonic()
+            for qtype in type_order:
+                question_data = self._pop_ready(pool.ready[qtype], exclude_ids)
+                if question_data is not None:
+                    break
+            self._schedule_refills(key, pool)
+
+        if question_data is None:
+            logger.info(f"Prefetch pool miss for topic '{topic}' ({preferred_type}).")
+        return question_data
+
+    @staticmethod
+    def _pop_ready(ready: deque, exclude_ids: Collection[str]) -> AnyQuizQuestionModel | None:
+        # Caller must hold self._lock.
+        for index, question_data in enumerate(ready):
+            if question_data.id not in exclude_ids:
+                del ready[index]
+                return question_data
+        return None
+
+    def get_or_generate(self, topic: str, preferred_type: str = "ANY") -> AnyQuizQuestionModel:
+        """Serves from the pool, falling back to a synchronous generation when it is empty."""
+        question_data = self.get(topic, preferred_type)
+        if question_data is not None:
+            return question_data
+        return self.generator(topic, preferred_type)
+
+    def warm(self, topic: str) -> None:
+        """Marks a topic active and queues refills without taking a question."""
+        self.start()
+        key = normalize_topic(topic)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = _TopicPool(topic)
+            pool.last_access = time.monotonic()
+            self._schedule_refills(key, pool)
+
+    def stats(self) -> dict:
+        """Ready/pending counts per topic, for debugging and sizing."""
+        with self._lock:
+            return {
+                key: {
+                    qtype: {"ready": len(pool.ready[qtype]), "pending": pool.pending[qtype]}
+                    for qtype in QUESTION_TYPES
+                }
+                for key, pool in self._pools.items()
+            }
+
+    # --- Internals ---
+
+    def _schedule_refills(self, key: str, pool: _TopicPool) -> None:
+        # Caller must hold self._lock.
+        if not self._threads:
+            return
+        for qtype in QUESTION_TYPES:
+            if len(pool.ready[qtype]) > self.low_watermark:
+                continue
+            missing = self.depth - len(pool.ready[qtype]) - pool.pending[qtype]
+            if missing <= 0:
+                continue
+            pool.pending[qtype] += missing
+            if self.batch_generator is not None:
+                self._tasks.put((key, qtype, missing))
+            else:
+                for _ in range(missing):
+                    self._tasks.put((key, qtype, 1))
+
+    def _worker_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                task = self._tasks.get(timeout=1.0)
+            except queue.Empty:
+                self._maybe_evict_idle()
+                continue
+            if task is None:
+                break
+            key, qtype, count = task
+
+            with self._lock:
+                pool = self._pools.get(key)
+                topic = pool.topic if pool else None
+            if topic is None:
+                continue  # Topic was evicted while the task was queued
+
+            questions: list[AnyQuizQuestionModel] = []
+            try:
+                with llm_priority(Priority.PREFETCH):  # Users waiting on a page go first
+                    if self.batch_generator is not None and count > 1:
+                        questions = self.batch_generator(topic, count, qtype)
+                    else:
+                        questions = [self.generator(topic, qtype) for _ in range(count)]
+            except Exception as e:
+                logger.error(f"Prefetch generation failed for topic '{topic}' ({qtype}): {type(e).__name__} - {e}")
+
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    continue
+                pool.pending[qtype] = max(pool.pending[qtype] - count, 0)
+                for question_data in questions:
+                    # Fallback questions are never pooled; the request path can produce those itself.
+                    if is_fallback_question(question_data) or question_data.question_type != qtype:
+                        continue
+                    if len(pool.ready[qtype]) < self.depth:
+                        pool.ready[qtype].append(question_data)
+
+    def _maybe_evict_idle(self) -> None:
+        now = time.monotonic()
+        if now - self._last_eviction < min(self.idle_ttl, 60.0):
+            return
+        self._last_eviction = now
+        with self._lock:
+            idle = [key for key, pool in self._pools.items() if now - pool.last_access > self.idle_ttl]
+            for key in idle:
+                del self._pools[key]
+        if idle:
+            logger.info(f"Evicted {len(idle)} idle topic(s) from the prefetch pool.")
@@ -0,0 +1,462 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Collection
+
+from pydantic import ValidationError
+
+from .dedup import NearDuplicateIndex
+from .llm_integration import (
+    generate_quiz_question,
+    generate_quiz_question_async,
+    duplicate_fallback,
+    generate_quiz_questions,
+    is_fallback_question,
+    normalize_topic,
+)
+from .metrics import TOPIC_RESOLUTIONS_TOTAL
+from .question_models import (
+    QUESTION_MODELS,
+    AnyQuizQuestionModel,
+    parse_question_json,
+    question_from_dict,
+    question_to_json,
+)
+from .topic_index import TopicIndex
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+QUESTION_BANK_PATH = os.getenv("QUIZ_QUESTION_BANK_PATH", "quiz_question_bank.sqlite3")
+QUESTION_BANK_MAX_ENTRIES = int(os.getenv("QUIZ_QUESTION_BANK_MAX_ENTRIES", "5000"))
+QUESTION_BANK_TTL = float(os.getenv("QUIZ_QUESTION_BANK_TTL", str(7 * 24 * 3600)))  # Seconds a stored question stays servable
+QUESTION_BANK_REUSE_RATIO = float(os.getenv("QUIZ_QUESTION_BANK_REUSE_RATIO", "0.8"))  # Share of requests answered from the bank
+QUESTION_BANK_MIN_PER_KEY = int(os.getenv("QUIZ_QUESTION_BANK_MIN_PER_KEY", "5"))  # Always generate until a key has this many
+
+GENERATION_ATTEMPTS = 2  # A near-duplicate with no unseen substitute is regenerated once
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id TEXT PRIMARY KEY,
+    topic_key TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_questions_key ON questions (topic_key, question_type);
+CREATE INDEX IF NOT EXISTS idx_questions_last_used ON questions (last_used);
+"""
+
+
+class QuestionBank:
+    """
+    Persistent SQLite store of validated questions, keyed by normalized topic and type.
+
+    `get_or_generate` answers a configurable share of requests (`reuse_ratio`)
+    from stored questions and sends the rest to the LLM so the bank keeps
+    growing fresh content. Entries expire after `ttl` seconds and the bank is
+    trimmed back to `max_entries` by evicting the least recently served rows.
+    Questions that near-duplicate one already stored for the topic (see
+    dedup.py) are rejected, and reads can exclude ids a session has seen.
+    `resolve_topic` maps free-text topics onto the banked topics they
+    refer to (see topic_index.py).
+    """
+
+    def __init__(self,
+                 path: str = QUESTION_BANK_PATH,
+                 generator: Callable[[str, str], AnyQuizQuestionModel] = generate_quiz_question,
+                 batch_generator: Callable[[str, int, dict], list[AnyQuizQuestionModel]] = generate_quiz_questions,
+                 async_generator: Callable[[str, str], Awaitable[AnyQuizQuestionModel]] = generate_quiz_question_async,
+                 max_entries: int = QUESTION_BANK_MAX_ENTRIES,
+                 ttl: float = QUESTION_BANK_TTL,
+                 reuse_ratio: float = QUESTION_BANK_REUSE_RATIO,
+                 min_per_key: int = QUESTION_BANK_MIN_PER_KEY,
+                 dedup: NearDuplicateIndex | None = None,
+                 topics: TopicIndex | None = None):
+        self.path = path
+        self.generator = generator
+        self.batch_generator = batch_generator
+        self.async_generator = async_generator
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.reuse_ratio = min(max(reuse_ratio, 0.0), 1.0)
+        self.min_per_key = min_per_key
+        self.dedup = dedup or NearDuplicateIndex()  # Loaded per topic from the stored rows on first write
+        self.topics = topics or TopicIndex()  # Loaded from the stored rows on first resolve
+        self._topics_loaded = False
+
+        self._lock = threading.Lock()
+        self._dedup_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+        self.counters = {"hits": 0, "misses": 0, "refreshes": 0, "stored": 0, "rejected": 0, "duplicates": 0, "evicted": 0,
+                         "fallbacks_avoided": 0, "duplicates_replaced": 0, "topics_resolved": 0}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- Reads ---
+
+    def resolve_topic(self, topic: str) -> str:
+        """
+        The banked topic that `topic` refers to ("WW2" -> "World War II"), or
+        `topic` itself when it matches none. Resolving before lookups lets
+        near-identical topics share one bucket instead of each starting cold.
+        """
+        self._load_topics()
+        match = self.topics.match(topic)
+        TOPIC_RESOLUTIONS_TOTAL.inc(method=match.method if match else "new")
+        if match is None:
+            return topic
+        if normalize_topic(match.topic) != normalize_topic(topic):
+            self.counters["topics_resolved"] += 1
+            logger.info(f"Resolved topic '{topic}' to banked topic '{match.topic}' ({match.method}, {match.score:.2f}).")
+        return match.topic
+
+    def get(self, topic: str, preferred_type: str = "ANY", exclude_ids: Collection[str] = ()) -> AnyQuizQuestionModel | None:
+        """
+        Returns a random non-expired stored question for the topic, or None.
+
+        Args:
+            topic: The quiz topic as entered by the user.
+            preferred_type: "MCQ", "DAD" or "ANY".
+            exclude_ids: Ids not to return (e.g. questions the session has already seen).
+        """
+        questions = self.get_many(topic, preferred_type, 1, exclude_ids)
+        return questions[0] if questions else None
+
+    def get_many(self, topic: str, preferred_type: str = "ANY", limit: int = 1,
+                 exclude_ids: Collection[str] = ()) -> list[AnyQuizQuestionModel]:
+        """Returns up to `limit` distinct random non-expired questions for the topic."""
+        key = normalize_topic(topic)
+        types = self._types_for(preferred_type)
+        placeholders = ",".join("?" * len(types))
+        exclude_ids = list(exclude_ids)
+        exclusion = f"AND id NOT IN ({','.join('?' * len(exclude_ids))}) " if exclude_ids else ""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, payload FROM questions WHERE topic_key = ? AND question_type IN ({placeholders}) "
+                f"AND created_at > ? {exclusion}ORDER BY RANDOM() LIMIT ?",
+                (key, *types, now - self.ttl, *exclude_ids, limit),
+            ).fetchall()
+            if rows:
+                self._conn.executemany("UPDATE questions SET last_used = ? WHERE id = ?", [(now, row[0]) for row in rows])
+                self._conn.commit()
+        return [parse_question_json(row[1]) for row in rows]
+
+    def stored_instead_of_fallback(self, topic: str, preferred_type: str, exclude_ids: Collection[str],
+                                   fallback: AnyQuizQuestionModel) -> AnyQuizQuestionModel:
+        """
+        A stored question, regardless of `reuse_ratio`, or `fallback` when
+        there is none. For callers that generated a fallback (LLM busy or
+        unavailable) and would rather serve a repeat-free stored question.
+        """
+        question_data = self.get(topic, preferred_type, exclude_ids)
+        if question_data is None:
+            return fallback
+        self.counters["fallbacks_avoided"] += 1
+        return question_data
+
+    def _get_by_id(self, question_id: str) -> AnyQuizQuestionModel | None:
+        """The stored question with this id, or None when it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM questions WHERE id = ? AND created_at > ?", (question_id, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE questions SET last_used = ? WHERE id = ?", (now, question_id))
+                self._conn.commit()
+        return parse_question_json(row[0]) if row is not None else None
+
+    def count(self, topic: str | None = None, preferred_type: str = "ANY") -> int:
+        """Number of live entries, optionally restricted to a topic and type."""
+        now = time.time()
+        with self._lock:
+            if topic is None:
+                return self._conn.execute(
+                    "SELECT COUNT(*) FROM questions WHERE created_at > ?", (now - self.ttl,)
+                ).fetchone()[0]
+            types = self._types_for(preferred_type)
+            placeholders = ",".join("?" * len(types))
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM questions WHERE topic_key = ? AND question_type IN ({placeholders}) AND created_at > ?",
+                (normalize_topic(topic), *types, now - self.ttl),
+            ).fetchone()[0]
+
+    # --- Writes ---
+
+    def put(self, question_data: Any) -> bool:
+        """Validates and stores one question. Fallbacks and invalid payloads are rejected."""
+        return self.put_many([question_data]) == 1
+
+    def put_many(self, questions: list[Any]) -> int:
+        """
+        Validates and stores a batch of questions in one transaction.
+
+        Returns:
+            The number of questions actually stored.
+        """
+        return len(self.store_new(questions))
+
+    def store_new(self, questions: list[Any]) -> list[AnyQuizQuestionModel]:
+        """
+        Like `put_many`, but returns the questions that were stored.
+
+        Question objects are stored as they are; dictionaries (e.g. imported
+        from JSON) are validated first. Invalid questions, fallbacks, ids
+        already in the bank and near-duplicates of stored questions
+        (including earlier ones in the same batch) are left out.
+        """
+        return self._store(questions)[0]
+
+    def _store(self, questions: list[Any]) -> tuple[list[AnyQuizQuestionModel], dict[str, str]]:
+        """
+        Implements `store_new`. Also returns, for each question left out as a
+        duplicate, the id of the stored question it duplicates.
+        """
+        rows = []
+        stored = []
+        duplicates: dict[str, str] = {}
+        now = time.time()
+        for question_data in questions:
+            try:
+                question = question_from_dict(question_data)  # Question objects pass through unvalidated
+            except ValidationError as e:
+                logger.warning(f"Refusing to store an invalid question: {e}")
+                self.counters["rejected"] += 1
+                continue
+            if is_fallback_question(question):
+                self.counters["rejected"] += 1
+                continue
+            topic_key = normalize_topic(question.topic)
+            duplicate_of = self._index_unless_duplicate(topic_key, question)
+            if duplicate_of is not None:
+                logger.info(f"Not storing question '{question.id}': near-duplicate of '{duplicate_of}'.")
+                self.counters["duplicates"] += 1
+                duplicates[question.id] = duplicate_of
+                continue
+            rows.append((question.id, topic_key, question.question_type, question_to_json(question).decode('utf-8'), now, now))
+            stored.append(question)
+
+        if not rows:
+            return [], duplicates
+        with self._lock:
+            # Ids already in the bank (e.g. the same question handed in twice) are
+            # left as they are and not reported as stored.
+            inserted = [
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO questions (id, topic_key, question_type, payload, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    row,
+                ).rowcount
+                for row in rows
+            ]
+            self._conn.commit()
+            duplicates.update((question.id, question.id) for question, count in zip(stored, inserted) if not count)
+            stored = [question for question, count in zip(stored, inserted) if count]
+            self.counters["stored"] += len(stored)
+            self.counters["duplicates"] += len(rows) - len(stored)
+            evicted = self._evict_locked()
+        self._forget(evicted)
+        for question in stored:
+            self.topics.add(question.topic)
+        return stored, duplicates
+
+    def evict(self) -> int:
+        """Drops expired entries and trims the bank to `max_entries`. Returns rows removed."""
+        with self._lock:
+            evicted = self._evict_locked()
+        self._forget(evicted)
+        return len(evicted)
+
+    # --- Read-through front for generate_quiz_question ---
+
+    def lookup(self, topic: str, preferred_type: str = "ANY", exclude_ids: Collection[str] = ()) -> AnyQuizQuestionModel | None:
+        """
+        Returns a stored question when this request should be served from the
+        bank (see `get_or_generate`), or None when the caller has to generate
+        one and `put` it. Questions in `exclude_ids` are never returned.
+        """
+        available = self.count(topic, preferred_type)
+        if available >= self.min_per_key and random.random() < self.reuse_ratio:
+            question_data = self.get(topic, preferred_type, exclude_ids)
+            if question_data is not None:
+                self.counters["hits"] += 1
+                return question_data
+            self.counters["misses"] += 1
+        elif available == 0:
+            self.counters["misses"] += 1
+        else:
+            self.counters["refreshes"] += 1
+        return None
+
+    def get_or_generate(self, topic: str, preferred_type: str = "ANY", exclude_ids: Collection[str] = ()) -> AnyQuizQuestionModel:
+        """
+        Serves a stored question or generates (and stores) a new one.
+
+        The LLM is called on a miss, while the key holds fewer than
+        `min_per_key` questions, or for the (1 - reuse_ratio) share of requests
+        that refresh the bank. What is served for a generated question is
+        decided by `serve_generated`; a near-duplicate without an unseen
+        substitute is regenerated once.
+        """
+        question_data = self.lookup(topic, preferred_type, exclude_ids)
+        if question_data is not None:
+            return question_data
+        for _ in range(GENERATION_ATTEMPTS):
+            question_data = self.generator(topic, preferred_type)
+            served = self.serve_generated(question_data, preferred_type, exclude_ids)
+            if served is not None:
+                return served
+        return duplicate_fallback(topic, question_data.question_type)
+
+    async def get_or_generate_async(self, topic: str, preferred_type: str = "ANY",
+                                    exclude_ids: Collection[str] = ()) -> AnyQuizQuestionModel:
+        """Same as `get_or_generate`, but generates through `generate_quiz_question_async`."""
+        question_data = self.lookup(topic, preferred_type, exclude_ids)
+        if question_data is not None:
+            return question_data
+        for _ in range(GENERATION_ATTEMPTS):
+            question_data = await self.async_generator(topic, preferred_type)
+            served = self.serve_generated(question_data, preferred_type, exclude_ids)
+            if served is not None:
+                return served
+        return duplicate_fallback(topic, question_data.question_type)
+
+    def serve_generated(self, question_data: AnyQuizQuestionModel, preferred_type: str = "ANY",
+                        exclude_ids: Collection[str] = ()) -> AnyQuizQuestionModel | None:
+        """
+        Stores a freshly generated question and returns what to serve in its place.
+
+        Returns:
+            The question itself once stored, or when it was already stored
+            under the same id and is not in `exclude_ids`. For a fallback
+            (e.g. the LLM quota scheduler turned the call away), any unseen
+            stored question, or the fallback when there is none. For a
+            near-duplicate of a stored question, an unseen stored question of
+            the requested type, else the stored near-match if its id is not
+            in `exclude_ids`, else None: the duplicate itself is never
+            served, and the caller regenerates or falls back.
+        """
+        topic = question_data.topic
+        if is_fallback_question(question_data):
+            return self.stored_instead_of_fallback(topic, preferred_type, exclude_ids, question_data)
+        stored, duplicates = self._store([question_data])
+        if stored:
+            return question_data
+        duplicate_of = duplicates.get(question_data.id)
+        if duplicate_of is None:
+            return question_data  # Not stored for another reason (invalid), but not a repeat either
+        if duplicate_of == question_data.id and duplicate_of not in exclude_ids:
+            return question_data  # Already stored, e.g. by another caller of a coalesced generation
+        substitute = self.get(topic, preferred_type, exclude_ids)
+        if substitute is None and duplicate_of not in exclude_ids:
+            substitute = self._get_by_id(duplicate_of)
+        if substitute is not None:
+            self.counters["duplicates_replaced"] += 1
+        return substitute
+
+    def get_or_generate_many(self, topic: str, count: int, preferred_type: str = "ANY") -> list[AnyQuizQuestionModel]:
+        """
+        Batch counterpart of `get_or_generate`, used to refill prefetch pools.
+
+        Roughly `reuse_ratio` of the requested questions come from the bank (once
+        the key holds `min_per_key` entries); the rest are produced by a single
+        batched LLM call and stored.
+        """
+        questions: list[AnyQuizQuestionModel] = []
+        if self.count(topic, preferred_type) >= self.min_per_key:
+            wanted = sum(random.random() < self.reuse_ratio for _ in range(count))
+            questions = self.get_many(topic, preferred_type, wanted)
+            self.counters["hits"] += len(questions)
+            self.counters["refreshes"] += count - wanted
+            self.counters["misses"] += wanted - len(questions)
+        else:
+            self.counters["misses"] += count
+
+        remaining = count - len(questions)
+        if remaining > 0:
+            type_mix = {preferred_type.upper(): 1} if preferred_type.upper() in QUESTION_MODELS else None
+            generated = self.batch_generator(topic, remaining, type_mix)
+            # Near-duplicates of banked questions are dropped rather than pooled.
+            questions.extend(self.store_new(generated))
+        return questions
+
+    def stats(self) -> dict:
+        """Hit/miss counters plus the current size, for sizing the bank."""
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["refreshes"]
+        return {
+            **self.counters,
+            "size": self.count(),
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    # --- Internals ---
+
+    def _load_topics(self) -> None:
+        if self._topics_loaded:
+            return
+        with self._lock:
+            if self._topics_loaded:
+                return
+            rows = self._conn.execute(
+                "SELECT topic_key, MIN(json_extract(payload, '$.topic')) FROM questions "
+                "WHERE created_at > ? GROUP BY topic_key", (time.time() - self.ttl,)
+            ).fetchall()
+            for _, topic in rows:
+                self.topics.add(topic)
+            self._topics_loaded = True
+
+    def _index_unless_duplicate(self, topic_key: str, question: AnyQuizQuestionModel) -> str | None:
+        """Adds the question to the near-duplicate index, or returns the id of the stored question it duplicates."""
+        with self._dedup_lock:
+            if not self.dedup.has_topic(topic_key):
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT payload FROM questions WHERE topic_key = ? ORDER BY created_at", (topic_key,)
+                    ).fetchall()
+                self.dedup.load(topic_key, [parse_question_json(row[0]) for row in rows])
+            return self.dedup.add(topic_key, question)
+
+    @staticmethod
+    def _types_for(preferred_type: str) -> tuple[str, ...]:
+        preferred_type = preferred_type.upper()
+        return (preferred_type,) if preferred_type in QUESTION_MODELS else tuple(QUESTION_MODELS)
+
+    def _evict_locked(self) -> list[tuple[str, str]]:
+        """Deletes expired rows and trims to `max_entries`. Returns the (id, topic_key) of removed rows."""
+        # Caller must hold self._lock, and pass the result to _forget once released.
+        cutoff = time.time() - self.ttl
+        evicted = self._conn.execute("SELECT id, topic_key FROM questions WHERE created_at <= ?", (cutoff,)).fetchall()
+        excess = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0] - len(evicted) - self.max_entries
+        if excess > 0:
+            evicted += self._conn.execute(
+                "SELECT id, topic_key FROM questions WHERE created_at > ? ORDER BY last_used ASC LIMIT ?", (cutoff, excess)
+            ).fetchall()
+        if evicted:
+            self._conn.executemany("DELETE FROM questions WHERE id = ?", [(question_id,) for question_id, _ in evicted])
+            self._conn.commit()
+            self.counters["evicted"] += len(evicted)
+            # The topic index is kept: a topic whose rows were all evicted still names
+            # the right bucket to regenerate into, and a reload per eviction would
+            # rescan the table on every resolve once the bank is full.
+            logger.info(f"Evicted {len(evicted)} question(s) from the question bank.")
+        return evicted
+
+    def _forget(self, evicted: list[tuple[str, str]]) -> None:
+        """Drops evicted questions from the near-duplicate index."""
+        if not evicted:
+            return
+        # Under _dedup_lock, so a topic being loaded from the rows can't bring them back.
+        with self._dedup_lock:
+            for question_id, topic_key in evicted:
+                self.dedup.remove(topic_key, question_id)
@@ -0,0 +1,131 @@
+"""
+Typed, immutable quiz question objects.
+
+Questions are frozen, slotted pydantic dataclasses. Every field is immutable
+(lists are tuples, `correct_matches` is a read-only mapping), so a question
+can be shared freely between the prefetch pool, the question bank, session
+state, the grader and the render cache without defensive copies.
+
+All validation goes through one discriminated union over `question_type`
+(`QUESTION_ADAPTER`), which parses JSON bytes directly into the right class.
+"""
+import logging
+from types import MappingProxyType
+from typing import Annotated, Any, Literal, Mapping, Union
+
+from pydantic import AfterValidator, Field, PlainSerializer, TypeAdapter, ValidationInfo, field_validator
+from pydantic.dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# A str -> str mapping that is read-only after validation and serializes as a plain JSON object
+FrozenStrMap = Annotated[
+    dict[str, str],
+    AfterValidator(MappingProxyType),
+    PlainSerializer(dict, return_type=dict[str, str]),
+]
+
+
+@dataclass(frozen=True, slots=True)
+class MCQQuestion:
+    id: str
+    topic: str
+    question_text: str
+    options: tuple[str, ...]
+    correct_answer: str
+    question_type: Literal["MCQ"] = "MCQ"
+    explanation: str | None = None
+
+    @field_validator('options')
+    @classmethod
+    def check_options_count(cls, v: tuple[str, ...]):
+        if not (2 <= len(v) <= 5):
+            raise ValueError('MCQ options list must contain between 2 and 5 items.')
+        return v
+
+    @field_validator('correct_answer')
+    @classmethod
+    def check_correct_answer_in_options(cls, v: str, info: ValidationInfo):
+        options_val = info.data.get('options')
+        if options_val and v not in options_val:
+            raise ValueError('Correct answer must be one of the provided options.')
+        return v
+
+    def to_dict(self) -> dict:
+        return question_to_dict(self)
+
+
+@dataclass(frozen=True, slots=True)
+class DragAndDropQuestion:
+    id: str
+    topic: str
+    question_text: str
+    draggable_items: tuple[str, ...]
+    drop_targets: tuple[str, ...]
+    correct_matches: FrozenStrMap
+    question_type: Literal["DAD"] = "DAD"
+    explanation: str | None = None
+
+    @field_validator('draggable_items', 'drop_targets')
+    @classmethod
+    def check_list_not_empty(cls, v: tuple[str, ...], info: ValidationInfo):
+        if not v:
+            raise ValueError(f"{info.field_name} list cannot be empty.")
+        if len(v) < 2: # Typically DAD questions need at least 2 items/targets
+             raise ValueError(f"{info.field_name} list must contain at least 2 items.")
+        return v
+
+    @field_validator('correct_matches')
+    @classmethod
+    def check_matches_logic(cls, v: Mapping[str, str], info: ValidationInfo):
+        if not v:
+            raise ValueError("correct_matches dictionary cannot be empty for a DAD question.")
+
+        draggable_items_set = set(info.data.get('draggable_items', ()))
+        drop_targets_set = set(info.data.get('drop_targets', ()))
+
+        if len(draggable_items_set) < len(v):
+            logger.warning("More matches defined than draggable items. Some matches might be ignored.")
+
+        for key, val_match in v.items():
+            if key not in draggable_items_set:
+                raise ValueError(f"Draggable item '{key}' in correct_matches not found in draggable_items list.")
+            if val_match not in drop_targets_set:
+                raise ValueError(f"Drop target '{val_match}' in correct_matches not found in drop_targets list.")
+        return v
+
+    def to_dict(self) -> dict:
+        return question_to_dict(self)
+
+
+QuizQuestion = Annotated[Union[MCQQuestion, DragAndDropQuestion], Field(discriminator="question_type")]
+AnyQuizQuestionModel = Union[MCQQuestion, DragAndDropQuestion]
+
+QUESTION_MODELS: dict[str, type] = {"MCQ": MCQQuestion, "DAD": DragAndDropQuestion}
+
+# Built once: constructing a TypeAdapter compiles the validator and serializer.
+QUESTION_ADAPTER: TypeAdapter[AnyQuizQuestionModel] = TypeAdapter(QuizQuestion)
+
+
+def parse_question_json(data: str | bytes) -> AnyQuizQuestionModel:
+    """Validates JSON text or bytes straight into a question object. Raises ValidationError."""
+    return QUESTION_ADAPTER.validate_json(data)
+
+
+def question_from_dict(data: Any) -> AnyQuizQuestionModel:
+    """Validates a dict (e.g. from a JSONL file) into a question object; question objects pass through as-is."""
+    return QUESTION_ADAPTER.validate_python(data)
+
+
+def question_to_dict(question: AnyQuizQuestionModel) -> dict:
+    """A JSON-compatible dict of the question (lists and plain dicts)."""
+    return QUESTION_ADAPTER.dump_python(question, mode="json")
+
+
+def question_to_json(question: AnyQuizQuestionModel) -> bytes:
+    return QUESTION_ADAPTER.dump_json(question)
+
+
+def question_json_schema(question_type: str) -> dict:
+    """The JSON schema of one question type, as shown to the LLM in prompts."""
+    return TypeAdapter(QUESTION_MODELS[question_type]).json_schema()
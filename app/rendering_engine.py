@@ -1,30 +1,172 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
 from flask import render_template
+from markupsafe import escape
+
+from .grader import (
+    GradeResult,
+    ITEM_CORRECT,
+    ITEM_INCORRECT,
+    ITEM_MISSED,
+    ITEM_DISTRACTOR,
+)
+from .metrics import RENDER_SECONDS
+from .question_models import AnyQuizQuestionModel, question_to_json
+
+# --- Rendered-fragment cache ---
+FRAGMENT_CACHE_SIZE = int(os.getenv("QUIZ_FRAGMENT_CACHE_SIZE", "1024"))
+
+_fragment_cache: OrderedDict[tuple[str, str], str] = OrderedDict()
+_fragment_cache_lock = threading.Lock()
+_template_generation = 0  # Bumped by invalidate_fragment_cache() so old fragments and ETags go stale
+
+# id(question) -> (question, content hash). Holding the question keeps its id() from being reused.
+_content_hashes: OrderedDict[int, tuple[AnyQuizQuestionModel, str]] = OrderedDict()
+_content_hashes_lock = threading.Lock()
+
+def question_content_hash(question: AnyQuizQuestionModel) -> str:
+    """
+    A short, stable hash of everything in the question, used in cache keys and ETags.
+
+    Questions are frozen, so the hash is computed once per question object
+    and reused by the fragment cache and page_etag.
+    """
+    key = id(question)
+    with _content_hashes_lock:
+        entry = _content_hashes.get(key)
+        if entry is not None and entry[0] is question:
+            _content_hashes.move_to_end(key)
+            return entry[1]
+    content_hash = hashlib.sha1(question_to_json(question)).hexdigest()[:16]
+    with _content_hashes_lock:
+        _content_hashes[key] = (question, content_hash)
+        if len(_content_hashes) > FRAGMENT_CACHE_SIZE:
+            _content_hashes.popitem(last=False)
+    return content_hash
+
+def invalidate_fragment_cache() -> None:
+    """Drops every cached fragment. Call this after the question templates change."""
+    global _template_generation
+    with _fragment_cache_lock:
+        _fragment_cache.clear()
+        _template_generation += 1
+
+def fragment_cache_stats() -> dict:
+    with _fragment_cache_lock:
+        return {"size": len(_fragment_cache), "max_size": FRAGMENT_CACHE_SIZE, "template_generation": _template_generation}
+
+def page_etag(question: AnyQuizQuestionModel, *extra: str | None) -> str:
+    """
+    ETag for a page showing the question plus any extra varying content (e.g. feedback).
+
+    It changes whenever the question content, the extra content or the
+    template generation changes.
+    """
+    digest = hashlib.sha1(f"{_template_generation}:{question_content_hash(question)}".encode('utf-8'))
+    for part in extra:
+        digest.update(b"\x00" + (part or "").encode('utf-8'))
+    return digest.hexdigest()[:32]
 
-def render_quiz_question(question_data: dict) -> str:
+def render_quiz_question(question: AnyQuizQuestionModel) -> str:
     """
     Renders a quiz question based on its type.
 
+    Fragments are kept in a bounded LRU cache keyed by question id and
+    content hash, so re-showing a question (feedback page, pooled questions)
+    skips the Jinja render.
+
     Args:
-        question_data: A dictionary containing the question details.
-                       Expected keys: 'question_type', 'question_text', 'options' (for MCQ).
+        question: The question object (MCQQuestion or DragAndDropQuestion).
 
     Returns:
         An HTML string for the rendered question, or an error message
         if the question type is unsupported.
     """
-    question_type = question_data.get('question_type')
+    start = time.perf_counter()
+    question_type = question.question_type
+    key = (question.id, question_content_hash(question))
+    with _fragment_cache_lock:
+        fragment = _fragment_cache.get(key)
+        if fragment is not None:
+            _fragment_cache.move_to_end(key)
+        generation = _template_generation
+    if fragment is not None:
+        RENDER_SECONDS.observe(time.perf_counter() - start, question_type=question_type, cache="hit")
+        return fragment
+
+    fragment = _render_question_fragment(question)
+    with _fragment_cache_lock:
+        if generation == _template_generation: # Not invalidated while rendering
+            _fragment_cache[key] = fragment
+            if len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+                _fragment_cache.popitem(last=False)
+    RENDER_SECONDS.observe(time.perf_counter() - start, question_type=question_type, cache="miss")
+    return fragment
+
+def _render_question_fragment(question: AnyQuizQuestionModel) -> str:
+    question_type = question.question_type
 
     if question_type == "MCQ":
         # Ensure the 'question' variable is passed to the template,
         # which matches the variable name used in mcq_question.html
-        return render_template('mcq_question.html', question=question_data)
+        return render_template('mcq_question.html', question=question)
     elif question_type == "DAD":
-        return render_template('dad_question.html', question=question_data)
+        return render_template('dad_question.html', question=question)
     else:
         # Log this occurrence for debugging or monitoring
         # import logging
         # logging.warning(f"Unsupported question type encountered: {question_type}")
-        return f"<p>Unsupported question type: {question_type}. Data: {question_data}</p>"
+        return f"<p>Unsupported question type: {question_type}. Data: {question}</p>"
+
+def render_feedback(result: GradeResult) -> str:
+    """
+    Turns a structured grade result into the feedback message shown on the quiz page.
+
+    Args:
+        result: The outcome of grader.grade for one submission.
+
+    Returns:
+        The feedback HTML. Question and answer text is escaped, so the result
+        can be inserted into the page as-is.
+    """
+    if result.error == "missing_answer_key":
+        return "Could not evaluate DAD question: missing correct answer data."
+    if result.error == "unsupported_type":
+        return "Unsupported question type encountered during submission."
+
+    if result.question_type == "MCQ":
+        explanation = result.explanation or 'No explanation provided.'
+        if result.is_correct:
+            return f"Correct! {escape(explanation)}"
+        return f"Incorrect. The correct answer was: {escape(result.correct_answer or 'N/A')}. Explanation: {escape(explanation)}"
+
+    feedback_details = []
+    for item in result.items:
+        if item.status == ITEM_CORRECT:
+            feedback_details.append(f"<li>Correct: '{escape(item.item)}' &rarr; '{escape(item.expected)}'</li>")
+        elif item.status == ITEM_INCORRECT:
+            feedback_details.append(f"<li>Incorrect: '{escape(item.item)}' placed on '{escape(item.placed_on)}', should be '{escape(item.expected)}'</li>")
+        elif item.status == ITEM_MISSED:
+            feedback_details.append(f"<li>Missed: '{escape(item.item)}' should go to '{escape(item.expected)}'</li>")
+        elif item.status == ITEM_DISTRACTOR:
+            feedback_details.append(f"<li>Distractor: '{escape(item.item)}' placed on '{escape(item.placed_on)}' (this item had no correct target).</li>")
+
+    if result.num_total and result.num_correct == result.num_total:
+        feedback_message = f"Excellent! All {result.num_total} matches are correct."
+    elif result.num_correct > 0:
+        feedback_message = f"Good effort! You got {result.num_correct} out of {result.num_total} primary matches correct."
+    else:
+        feedback_message = f"Needs improvement. None of the {result.num_total} primary matches were correct."
+    if feedback_details:
+        feedback_message += "<ul>" + "".join(feedback_details) + "</ul>"
+
+    if result.explanation:
+        feedback_message += f"<p><strong>Overall Explanation:</strong> {escape(result.explanation)}</p>"
+    return feedback_message
 
 if __name__ == '__main__':
     # This part won't run correctly without a Flask app context for render_template.
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (overridable through the environment) ---
+SESSION_STORE_BACKEND = os.getenv("QUIZ_SESSION_BACKEND", "sqlite")  # "sqlite", or "memory" for a single worker process
+SESSION_STORE_DB_PATH = os.getenv("QUIZ_SESSION_DB_PATH", "quiz_sessions.sqlite3")
+SESSION_TTL = float(os.getenv("QUIZ_SESSION_TTL", str(2 * 3600)))  # Seconds of inactivity before a session expires
+SESSION_SWEEP_INTERVAL = float(os.getenv("QUIZ_SESSION_SWEEP_INTERVAL", "60"))
+
+
+def _encode_state_value(value):
+    """json.dumps hook for state values that are not plain JSON (question objects)."""
+    to_dict = getattr(value, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return to_dict()
+
+
+def new_session_id() -> str:
+    """An opaque, unguessable id; the only quiz state the cookie carries besides the question id."""
+    return secrets.token_urlsafe(16)
+
+
+class QuizStateStore:
+    """
+    Server-side store for per-session quiz state (topic, current question, feedback).
+
+    Keeping the state here means the signed session cookie only has to carry
+    an opaque session id and the current question id, and the answer key
+    never reaches the client. State is a dict of JSON-serializable values
+    and question objects; backends that serialize it store question objects
+    as their `to_dict()`, and readers rehydrate them. Entries
+    expire `ttl` seconds after they were last written, and expired entries
+    are swept at most every `sweep_interval` seconds.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def get(self, session_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def set(self, session_id: str, state: dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Removes expired sessions. Returns how many were removed."""
+        raise NotImplementedError
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        removed = self.sweep()
+        if removed:
+            logger.info(f"Swept {removed} expired quiz session(s).")
+
+
+class InMemoryQuizStateStore(QuizStateStore):
+    """Process-local backend. Fast, but state is lost on restart and not shared between workers."""
+
+    def __init__(self, ttl: float = SESSION_TTL, sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        super().__init__(ttl, sweep_interval)
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[float, dict]] = {}
+
+    def get(self, session_id: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def set(self, session_id: str, state: dict) -> None:
+        with self._lock:
+            self._entries[session_id] = (time.time() + self.ttl, state)
+        self._maybe_sweep()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+
+class SQLiteQuizStateStore(QuizStateStore):
+    """SQLite backend, shared by every worker process pointed at the same file."""
+
+    def __init__(self,
+                 path: str = SESSION_STORE_DB_PATH,
+                 ttl: float = SESSION_TTL,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        super().__init__(ttl, sweep_interval)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS quiz_sessions ("
+            " session_id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_quiz_sessions_expires ON quiz_sessions (expires_at);"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM quiz_sessions WHERE session_id = ? AND expires_at > ?",
+                (session_id, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id: str, state: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quiz_sessions (session_id, state, expires_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, default=_encode_state_value), time.time() + self.ttl),
+            )
+            self._conn.commit()
+        self._maybe_sweep()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM quiz_sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def sweep(self) -> int:
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM quiz_sessions WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_state_store(backend: str = SESSION_STORE_BACKEND) -> QuizStateStore:
+    """Builds the configured backend ("sqlite" or "memory")."""
+    if backend == "memory":
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning("The in-memory session store is not shared between worker processes; quiz state is lost "
+                           "whenever a request reaches another worker. Use QUIZ_SESSION_BACKEND=sqlite.")
+        return InMemoryQuizStateStore()
+    if backend != "sqlite":
+        logger.warning(f"Unknown session backend '{backend}'. Using the SQLite store.")
+    return SQLiteQuizStateStore()
@@ -0,0 +1,90 @@
+"""
+Request coalescing ("singleflight").
+
+When many callers ask for the same thing at once (a classroom starting the
+same topic), only the first one does the work; the others wait for it and
+share its result or exception. Nothing is cached: once the call finishes,
+the next caller starts a fresh one.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Runs `func` unless a call for `key` is already in flight, in which case
+        waits for that call instead.
+
+        Returns:
+            (result, shared): `shared` is True for callers that received another
+            caller's result, so they can copy it before handing it out.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent coroutines with the same key.
+
+    Must only be used from one event loop (the LLM loop in llm_integration),
+    so no locking is needed.
+    """
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, coro_factory: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Async counterpart of SingleFlight.do; `coro_factory` is only called by the leader."""
+        task = self._tasks.get(key)
+        if task is not None:
+            # shield: a cancelled follower must not cancel the leader's call
+            return await asyncio.shield(task), True
+        task = asyncio.ensure_future(coro_factory())
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
@@ -0,0 +1,229 @@
+"""
+Related-topic lookup over the topics the question bank already holds.
+
+Topics arrive as free text, so "World War II", "world war 2" and "WW2" would
+otherwise be three cold buckets. `TopicIndex.match` resolves a new topic
+string to an indexed one in three steps:
+
+1. Canonical tokens: casefolded words without punctuation or stop words,
+   with a simple plural strip, and number words, ordinals and trailing roman
+   numerals turned into digits. Topics with the same token set match.
+2. Acronyms: "ww2" matches "World War 2", because the initials of the
+   topic's words followed by its numbers give "ww2". An acronym shared by
+   several topics is ambiguous and never matched.
+3. Fuzzy: typos ("Solar Sistem", "photosythesis"). Candidates come from a
+   trigram inverted index and must reach `threshold` Dice similarity over
+   character trigrams, so a lookup only touches topics that share trigrams
+   with the query. A candidate then matches only if its words pair up with
+   the query's one to one, each pair starting with the same letter and
+   within one typo (two for words of 8+ letters). Similar-looking topics
+   such as "Organic"/"Inorganic Chemistry" or "World War 1"/"World War 2"
+   never match.
+"""
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+# --- Configuration (overridable through the environment) ---
+TOPIC_MATCH_THRESHOLD = float(os.getenv("QUIZ_TOPIC_MATCH_THRESHOLD", "0.5"))  # Trigram similarity for a fuzzy candidate
+
+STOP_WORDS = frozenset({"a", "an", "the", "of", "and", "in", "on", "to", "for", "about", "with"})
+NUMBER_WORDS = {word: str(number) for number, word in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve".split())}
+NUMBER_WORDS.update({word: str(number) for number, word in enumerate(
+    "zeroth first second third fourth fifth sixth seventh eighth ninth tenth".split()) if number})
+ROMAN_NUMERALS = {numeral: str(number) for number, numeral in enumerate(
+    "i ii iii iv v vi vii viii ix x xi xii".split(), start=1)}
+ORDINAL_SUFFIXES = frozenset({"st", "nd", "rd", "th"})
+
+MIN_TYPO_LENGTH = 4  # Shorter words must match exactly
+LONG_WORD_LENGTH = 8  # Words this long may have two typos
+MAX_ACRONYM_LENGTH = 6
+
+_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+
+
+def topic_tokens(topic: str) -> list[str]:
+    """Canonical tokens of a topic, in order (see the module docstring)."""
+    tokens: list[str] = []
+    for position, token in enumerate(_TOKEN.findall(topic.casefold())):
+        if token in ORDINAL_SUFFIXES and tokens and tokens[-1].isdigit():
+            continue  # "2nd" -> "2"
+        if token in STOP_WORDS:
+            continue
+        if token.isdigit():
+            token = str(int(token))
+        elif token in NUMBER_WORDS:
+            token = NUMBER_WORDS[token]
+        elif position and token in ROMAN_NUMERALS:
+            token = ROMAN_NUMERALS[token]  # Not as the first word: "X-rays", "I, Robot"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _canonical(tokens: list[str]) -> str:
+    return " ".join(sorted(set(tokens)))
+
+
+def _acronym(tokens: list[str]) -> str | None:
+    """'world war 2' -> 'ww2'. Needs at least two words."""
+    words = [token for token in tokens if not token.isdigit()]
+    if len(words) < 2:
+        return None
+    return "".join(word[0] for word in words) + "".join(token for token in tokens if token.isdigit())
+
+
+def _compact(tokens: list[str]) -> list[str]:
+    """
+    What the topic would be if it was typed as an acronym: 'ww2' (or 'ww 2')
+    -> ['ww2'], and 'wwii' -> ['wwii', 'ww2'] for a trailing roman numeral.
+    """
+    compact = "".join(tokens)
+    if len(tokens) > 2 or len(compact) > MAX_ACRONYM_LENGTH or compact.isdigit():
+        return []
+    forms = [compact]
+    if len(tokens) == 1:
+        for split in range(2, len(compact) - 1):
+            if compact[split:] in ROMAN_NUMERALS:
+                forms.append(compact[:split] + ROMAN_NUMERALS[compact[split:]])
+    return forms
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count as one edit), or limit + 1 once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def _typos(query: tuple[str, ...], candidate: tuple[str, ...]) -> int | None:
+    """
+    Total typos when the words of `query` pair up one to one with those of
+    `candidate` (each pair starting with the same letter and within its typo
+    budget), or None when they don't.
+    """
+    if len(query) != len(candidate):
+        return None
+    unused = list(candidate)
+    total = 0
+    for word in sorted(query, key=len, reverse=True):
+        budget = 0 if word.isdigit() or len(word) < MIN_TYPO_LENGTH else 1 if len(word) < LONG_WORD_LENGTH else 2
+        best, best_distance = None, budget + 1
+        for other in unused:
+            if other[0] != word[0]:
+                continue
+            distance = _edit_distance(word, other, budget)
+            if distance < best_distance:
+                best, best_distance = other, distance
+        if best is None:
+            return None
+        unused.remove(best)
+        total += best_distance
+    return total
+
+
+def _trigrams(canonical: str) -> frozenset[str]:
+    padded = f" {canonical} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+@dataclass(frozen=True)
+class TopicMatch:
+    topic: str    # The indexed topic, as first added
+    method: str   # "exact", "acronym" or "fuzzy"
+    score: float  # Trigram similarity; 1.0 for exact and acronym matches
+
+
+@dataclass
+class _Entry:
+    topic: str
+    words: tuple[str, ...]
+    trigrams: frozenset[str]
+
+
+class TopicIndex:
+    """
+    Thread-safe index of known topics for `match`. Topics with the same
+    canonical form share one entry, named after the first one added.
+    """
+
+    def __init__(self, threshold: float = TOPIC_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}           # canonical form -> entry
+        self._postings: dict[str, set[str]] = {}        # trigram -> canonical forms
+        self._acronyms: dict[str, set[str]] = {}        # acronym -> canonical forms
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def add(self, topic: str) -> None:
+        tokens = topic_tokens(topic)
+        canonical = _canonical(tokens)
+        if not canonical:
+            return
+        with self._lock:
+            if canonical in self._entries:
+                return
+            entry = _Entry(topic, tuple(canonical.split()), _trigrams(canonical))
+            self._entries[canonical] = entry
+            for trigram in entry.trigrams:
+                self._postings.setdefault(trigram, set()).add(canonical)
+            acronym = _acronym(tokens)
+            if acronym:
+                self._acronyms.setdefault(acronym, set()).add(canonical)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._acronyms.clear()
+
+    def match(self, topic: str) -> TopicMatch | None:
+        """The indexed topic `topic` refers to, or None when it is a new topic."""
+        tokens = topic_tokens(topic)
+        canonical = _canonical(tokens)
+        if not canonical:
+            return None
+        with self._lock:
+            entry = self._entries.get(canonical)
+            if entry is not None:
+                return TopicMatch(entry.topic, "exact", 1.0)
+
+            for compact in _compact(tokens):
+                candidates = self._acronyms.get(compact, ())
+                if len(candidates) == 1:
+                    return TopicMatch(self._entries[next(iter(candidates))].topic, "acronym", 1.0)
+
+            trigrams = _trigrams(canonical)
+            shared: Counter[str] = Counter()
+            for trigram in trigrams:
+                shared.update(self._postings.get(trigram, ()))
+            words = tuple(canonical.split())
+            best, best_key = None, None
+            for candidate, overlap in shared.items():
+                entry = self._entries[candidate]
+                score = 2 * overlap / (len(trigrams) + len(entry.trigrams))
+                if score < self.threshold:
+                    continue
+                typos = _typos(words, entry.words)
+                if typos is None:
+                    continue
+                if best_key is None or (typos, -score) < best_key:
+                    best, best_key = TopicMatch(entry.topic, "fuzzy", score), (typos, -score)
+            return best
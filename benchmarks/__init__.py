@@ -0,0 +1 @@
+# Local performance benchmarks; see bench_routes.py and bench_micro.py.
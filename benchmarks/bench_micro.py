@@ -0,0 +1,84 @@
+"""
+Microbenchmarks for the CPU-bound stages of serving a question, with no LLM
+or HTTP involved: prompt building, response validation, grading and
+rendering (cold and from the fragment cache).
+
+    python -m benchmarks.bench_micro --iterations 5000
+"""
+import argparse
+import json
+import logging
+import random
+import time
+
+from .common import isolate_storage
+
+
+def _measure(name: str, func, iterations: int, results: dict) -> None:
+    func()  # Warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    results[name] = (elapsed / iterations * 1e6, iterations / elapsed)
+
+
+def run(args: argparse.Namespace) -> None:
+    isolate_storage()
+    from app.fake_llm import fake_dad_question, fake_mcq_question, use_fake_llm
+    use_fake_llm(latency=0.0, jitter=0.0)
+    from app.grader import clear_answer_index_cache, grade
+    from app.llm_integration import get_generator, parse_question_json, question_from_dict
+    from app.main import create_app
+    from app.rendering_engine import invalidate_fragment_cache, render_quiz_question
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    mcq = question_from_dict(fake_mcq_question("Benchmark Topic", rng))
+    dad = question_from_dict(fake_dad_question("Benchmark Topic", rng))
+    mcq_json, dad_json = (json.dumps(question.to_dict()).encode('utf-8') for question in (mcq, dad))
+    mcq_submission = {"answer": mcq.options[0]}
+    dad_submission = {"dad_answers": dict(zip(dad.draggable_items, reversed(dad.drop_targets)))}
+    generator = get_generator()
+
+    results: dict[str, tuple[float, float]] = {}
+    n = args.iterations
+    _measure("prompt build (MCQ)", lambda: generator.build_prompt("Benchmark Topic", "MCQ"), n, results)
+    _measure("validate MCQ JSON", lambda: parse_question_json(mcq_json), n, results)
+    _measure("validate DAD JSON", lambda: parse_question_json(dad_json), n, results)
+
+    def grade_cold(question, submission):
+        clear_answer_index_cache()
+        return grade(question, submission)
+
+    _measure("grade MCQ (cold)", lambda: grade_cold(mcq, mcq_submission), n, results)
+    _measure("grade MCQ (indexed)", lambda: grade(mcq, mcq_submission), n, results)
+    _measure("grade DAD (cold)", lambda: grade_cold(dad, dad_submission), n, results)
+    _measure("grade DAD (indexed)", lambda: grade(dad, dad_submission), n, results)
+
+    def render_cold(question):
+        invalidate_fragment_cache()
+        return render_quiz_question(question)
+
+    with app.test_request_context():
+        _measure("render MCQ (cold)", lambda: render_cold(mcq), n, results)
+        _measure("render MCQ (cached)", lambda: render_quiz_question(mcq), n, results)
+        _measure("render DAD (cold)", lambda: render_cold(dad), n, results)
+        _measure("render DAD (cached)", lambda: render_quiz_question(dad), n, results)
+
+    print(f"\nMicrobenchmarks ({n} iterations each)")
+    print(f"{'':<24}{'us/op':>12}{'ops/s':>14}")
+    for name, (micros, ops) in results.items():
+        print(f"{name:<24}{micros:>12.2f}{ops:>14.0f}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmark validation, grading and rendering.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Drives the quiz routes end to end against the deterministic fake LLM.
+
+Each simulated user starts a quiz, then repeatedly answers, views feedback
+and asks for the next question. With --api, users answer and move on through
+the JSON API the way the quiz page's scripts do (one request each). Per-route
+latency percentiles and overall throughput are printed at the end.
+
+    python -m benchmarks.bench_routes --users 20 --rounds 10 --latency 0.2 --jitter 0.05 --malformed-rate 0.05
+"""
+import argparse
+import html
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from .common import isolate_storage, print_table, summarize
+
+DEFAULT_TOPICS = ["Solar System", "World War II", "Python Basics", "Cell Biology"]
+
+_QUESTION_ID = re.compile(r'name="question_id" value="([^"]*)"')
+_MCQ_OPTION = re.compile(r'name="answer" value="([^"]*)"')
+_DAD_ITEM = re.compile(r'data-item-value="([^"]*)"')
+_DAD_TARGET = re.compile(r'data-target-value="([^"]*)"')
+_FINAL_EVENT = re.compile(r"event: final\ndata: (.*)\n")
+
+
+def _question_html(page: str) -> str:
+    """The question markup from a quiz page, an API response or the final event of a question stream."""
+    match = _FINAL_EVENT.search(page)
+    if match:
+        return json.loads(match.group(1))["question_html"]
+    if page.startswith("{"):
+        return json.loads(page).get("question_html", "")
+    return page
+
+
+def _answer_form(page: str, rng: random.Random) -> dict | None:
+    """Builds a (random) answer submission for the question on the page."""
+    question_html = _question_html(page)
+    question_id = _QUESTION_ID.search(question_html)
+    if not question_id:
+        return None
+    form = {"question_id": html.unescape(question_id.group(1))}
+
+    options = _MCQ_OPTION.findall(question_html)
+    if options:
+        form["answer"] = html.unescape(rng.choice(options))
+        return form
+
+    items = [html.unescape(item) for item in _DAD_ITEM.findall(question_html)]
+    targets = [html.unescape(t) for t in _DAD_TARGET.findall(question_html) if t != "source_container"]
+    rng.shuffle(targets)
+    form["question_type"] = "DAD"
+    form["dad_answers"] = json.dumps(dict(zip(items, targets)))
+    return form
+
+
+def run(args: argparse.Namespace) -> None:
+    isolate_storage()
+    os.environ["QUIZ_STREAMING"] = "1" if args.streaming else "0"
+
+    from app.fake_llm import use_fake_llm
+    from app.llm_scheduler import LLMScheduler
+    scheduler = LLMScheduler(requests_per_minute=args.rpm, tokens_per_minute=0) if args.rpm else None
+    model = use_fake_llm(coalesce=not args.no_coalesce, scheduler=scheduler, latency=args.latency,
+                         jitter=args.jitter, malformed_rate=args.malformed_rate, seed=args.seed)
+    from app.main import create_app, services
+    from app.metrics import FALLBACKS_TOTAL, LLM_COALESCED_TOTAL, LLM_SCHEDULER_ADMISSIONS_TOTAL
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)  # Per-request INFO logs would dominate the timings
+
+    samples: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+
+    def timed(route: str, call):
+        start = time.perf_counter()
+        response = call()
+        body = response.get_data(as_text=True)  # Streams are consumed inside the timing
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples[route].append(elapsed)
+            if response.status_code >= 400:
+                errors[route] += 1
+        return body
+
+    def user(user_id: int) -> None:
+        rng = random.Random(args.seed * 1000 + user_id)
+        client = app.test_client()
+        topic = rng.choice(args.topics)
+
+        page = timed("/start_quiz", lambda: client.post("/start_quiz", data={"topic": topic}))
+        for _ in range(args.rounds):
+            if "data-stream-url" in page or '"stream_url"' in page:
+                page = timed("/stream_question", lambda: client.get("/stream_question"))
+            form = _answer_form(page, rng)
+            if form is None:
+                with lock:
+                    errors["(no question)"] += 1
+            elif args.api:
+                if "dad_answers" in form:
+                    body = {"question_id": form["question_id"], "dad_answers": json.loads(form["dad_answers"])}
+                else:
+                    body = {"question_id": form["question_id"], "answer": form["answer"]}
+                timed("/api/quiz/answer", lambda: client.post("/api/quiz/answer", json=body))
+            else:
+                timed("/submit_answer", lambda: client.post("/submit_answer", data=form))
+                timed("/show_feedback", lambda: client.get("/show_feedback"))
+            if args.api:
+                page = timed("/api/quiz/next", lambda: client.post("/api/quiz/next"))
+            else:
+                page = timed("/next_question", lambda: client.get("/next_question"))
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(args.users)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+    services().prefetch_pool.stop()
+
+    rows = {}
+    for route, route_samples in samples.items():
+        rows[route] = summarize(route_samples)
+        rows[route]["errors"] = errors.get(route, 0)
+    total_requests = sum(len(route_samples) for route_samples in samples.values())
+
+    print_table(f"Routes ({args.users} users x {args.rounds} rounds, LLM latency {args.latency}s "
+                f"+/- {args.jitter}s, malformed rate {args.malformed_rate})", rows, ("errors",))
+    print(f"\nThroughput: {total_requests / wall_time:.1f} requests/s over {wall_time:.2f}s ({total_requests} requests)")
+    print(f"Fake LLM calls: {model.calls} "
+          f"(coalesced requests: {LLM_COALESCED_TOTAL.value(kind='single'):.0f} single, {LLM_COALESCED_TOTAL.value(kind='batch'):.0f} batch)")
+    print(f"Question bank: {services().question_bank.stats()}")
+    services().answer_log.flush()
+    print(f"Answer log: {services().answer_log.stats()}")
+    if scheduler is not None:
+        outcomes = {(priority, outcome): LLM_SCHEDULER_ADMISSIONS_TOTAL.value(priority=priority, outcome=outcome)
+                    for priority in ("interactive", "prefetch") for outcome in ("immediate", "queued", "rejected", "timed_out")}
+        print("Scheduler admissions: " + ", ".join(f"{p}/{o}={n:.0f}" for (p, o), n in outcomes.items() if n))
+        print(f"Busy fallbacks: {sum(FALLBACKS_TOTAL.value(reason='quota_exceeded', question_type=t) for t in ('MCQ', 'DAD')):.0f}")
+    if errors.get("(no question)"):
+        print(f"Pages without an answerable question: {errors['(no question)']}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the quiz routes against a fake LLM.")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=5, help="Questions answered per user")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mean fake LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.03, help="Max +/- latency jitter in seconds")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of fake LLM responses with broken JSON")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--streaming", action="store_true", help="Serve pool misses through /stream_question")
+    parser.add_argument("--no-coalesce", action="store_true", help="Give every generation request its own LLM call")
+    parser.add_argument("--api", action="store_true", help="Answer and fetch next questions through the JSON API")
+    parser.add_argument("--rpm", type=float, default=0, help="Rate limit fake LLM calls like a metered backend (requests per minute)")
+    parser.add_argument("--topics", nargs="+", default=DEFAULT_TOPICS)
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: how long a fresh worker process takes to import the
+app, build it and answer its first page, each run in a new interpreter.
+
+    python -m benchmarks.bench_startup --runs 10
+
+Scenarios:
+  lazy / cold cache   the default import path, with an empty template bytecode cache
+  lazy / warm cache   the same, with the bytecode cache filled by an earlier run
+  eager SDK import    imports google.generativeai up front, as the app used to
+  no bytecode cache   QUIZ_TEMPLATE_BYTECODE_CACHE=0
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from .common import isolate_storage, print_table, summarize
+
+# Runs in the child process; prints one JSON line of phase timings in seconds.
+_PROBE = """
+import json, logging, sys, time
+start = time.perf_counter()
+if {eager_sdk}:
+    import google.generativeai
+import app.main
+imported = time.perf_counter()
+flask_app = app.main.create_app()
+created = time.perf_counter()
+logging.getLogger().setLevel(logging.WARNING)
+response = flask_app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+first = time.perf_counter()
+print(json.dumps({{"import": imported - start, "create": created - imported, "first": first - created}}))
+"""
+
+
+def _run_probe(env: dict[str, str], eager_sdk: bool) -> dict[str, float]:
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", _PROBE.format(eager_sdk=eager_sdk)],
+                            env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(args: argparse.Namespace) -> None:
+    isolate_storage()
+    base_env = dict(os.environ, QUIZ_LLM_BACKEND="stub", QUIZ_PRELOAD="0")
+    scenarios = {
+        "lazy / cold cache": ({}, False, True),
+        "lazy / warm cache": ({}, False, False),
+        "eager SDK import": ({}, True, False),
+        "no bytecode cache": ({"QUIZ_TEMPLATE_BYTECODE_CACHE": "0"}, False, False),
+    }
+
+    rows: dict[str, dict[str, float]] = {}
+    for name, (overrides, eager_sdk, clear_cache) in scenarios.items():
+        cache_dir = tempfile.mkdtemp(prefix="quiz-bench-jinja-")
+        env = dict(base_env, QUIZ_TEMPLATE_CACHE_DIR=cache_dir, **overrides)
+        if not clear_cache:
+            _run_probe(env, eager_sdk)  # Fills the bytecode cache
+        phases: dict[str, list[float]] = {"import": [], "create": [], "first": []}
+        for _ in range(args.runs):
+            if clear_cache:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            for phase, seconds in _run_probe(env, eager_sdk).items():
+                phases[phase].append(seconds)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        totals = [sum(values) for values in zip(*phases.values())]
+        rows[name] = summarize(totals)
+        for phase, values in phases.items():
+            rows[name][f"{phase}_ms"] = summarize(values)["p50_ms"]
+
+    print_table(f"Startup to first response ({args.runs} fresh processes each; "
+                f"p50 per phase: import, create_app(), first GET /)",
+                rows, extra_columns=("import_ms", "create_ms", "first_ms"))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark process start-up and first-request latency.")
+    parser.add_argument("--runs", type=int, default=5)
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
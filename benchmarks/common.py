@@ -0,0 +1,48 @@
+import math
+import os
+import tempfile
+
+
+def isolate_storage() -> str:
+    """
+    Points every on-disk store at a throwaway directory.
+
+    Must run before app.main is imported, since its configuration is read
+    from these environment variables at import time.
+    """
+    directory = tempfile.mkdtemp(prefix="quiz-bench-")
+    os.environ["QUIZ_QUESTION_BANK_PATH"] = os.path.join(directory, "question_bank.sqlite3")
+    os.environ["QUIZ_SESSION_DB_PATH"] = os.path.join(directory, "sessions.sqlite3")
+    os.environ["QUIZ_ANSWER_LOG_PATH"] = os.path.join(directory, "answer_events.sqlite3")
+    return directory
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Count, mean and p50/p95/p99 of latency samples in seconds (reported in ms)."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": (sum(ordered) / len(ordered) * 1000) if ordered else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+    }
+
+
+def print_table(title: str, rows: dict[str, dict[str, float]], extra_columns: tuple[str, ...] = ()) -> None:
+    columns = ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms") + extra_columns
+    print(f"\n{title}")
+    print(f"{'':<22}" + "".join(f"{column:>12}" for column in columns))
+    for name, stats in rows.items():
+        print(f"{name:<22}" + "".join(
+            f"{stats.get(column, 0):>12.2f}" if isinstance(stats.get(column, 0), float) else f"{stats.get(column, 0):>12}"
+            for column in columns
+        ))
@@ -1,8 +1,13 @@
-document.addEventListener('DOMContentLoaded', () => {
+// Wires up the drag-and-drop question currently in the page. Exposed globally so
+// a question swapped in after load (e.g. by quiz_stream.js) can be initialised.
+function initDragDrop() {
     const draggableItems = document.querySelectorAll('.draggable-item');
     const dropTargets = document.querySelectorAll('.drop-target'); // Includes the source container if classed as such
     const dadForm = document.getElementById('dad-form');
     const dadAnswersInput = document.getElementById('dad_answers_input');
+    if (!dadAnswersInput) {
+        return; // No drag-and-drop question on this page
+    }
     const draggableContainer = document.getElementById('draggable-container');
 
     let currentSelections = {}; // Stores { "draggedItemText": "dropTargetValue" }
@@ -100,10 +105,25 @@ document.addEventListener('DOMContentLoaded', () => {
                 dadAnswersInput.value = JSON.stringify({});
             }
             console.log('DAD form submitted with answers:', dadAnswersInput.value);
-            // Allow default submission
+            // Grade through the JSON API when it is loaded; otherwise allow default submission
+            if (window.QuizApi && dadForm.dataset.apiUrl) {
+                event.preventDefault();
+                window.QuizApi.submitAnswer(dadForm, {
+                    question_id: dadForm.querySelector('input[name="question_id"]').value,
+                    dad_answers: currentSelections,
+                });
+            }
         });
     }
 
     // Initial update in case of no interactions
     updateHiddenInput();
-});
+}
+
+window.initDragDrop = initDragDrop;
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initDragDrop);
+} else {
+    initDragDrop(); // Loaded after the page was parsed
+}
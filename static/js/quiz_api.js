@@ -0,0 +1,119 @@
+// Answers questions and moves to the next one through the JSON API, so a
+// question costs one request to grade and one to replace it instead of a
+// form POST, a redirect and two full page renders. The plain form and link
+// targets keep working when this script is not loaded.
+const QuizApi = (() => {
+    function feedbackClass(result) {
+        if (result.error) {
+            return 'feedback-neutral';
+        }
+        return result.is_correct ? 'feedback-correct' : 'feedback-incorrect';
+    }
+
+    // feedbackHtml comes from the server, which escapes all question and answer text.
+    function showFeedback(feedbackHtml, className) {
+        const area = document.getElementById('feedback-area');
+        if (!area) {
+            return;
+        }
+        area.innerHTML = '';
+        if (!feedbackHtml) {
+            return;
+        }
+        const box = document.createElement('div');
+        box.className = `feedback ${className}`;
+        const message = document.createElement('div');
+        message.className = 'feedback-message';
+        message.innerHTML = feedbackHtml;
+        box.appendChild(message);
+        area.appendChild(box);
+    }
+
+    function showError(message) {
+        const text = document.createElement('div');
+        text.textContent = message;
+        showFeedback(text.innerHTML, 'feedback-neutral');
+    }
+
+    async function postJson(url, body) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'Accept': 'application/json'},
+            credentials: 'same-origin',
+            body: JSON.stringify(body || {}),
+        });
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(data.error || `Request failed (${response.status}).`);
+        }
+        return data;
+    }
+
+    // Grades an answer: {question_id, answer} for MCQ or {question_id, dad_answers} for DAD.
+    async function submitAnswer(form, answer) {
+        const button = form.querySelector('button[type="submit"]');
+        if (button) {
+            button.disabled = true;
+        }
+        try {
+            const data = await postJson(form.dataset.apiUrl, answer);
+            showFeedback(data.feedback_html, feedbackClass(data.result));
+        } catch (error) {
+            showError(error.message);
+        } finally {
+            if (button) {
+                button.disabled = false;
+            }
+        }
+    }
+
+    async function nextQuestion(link) {
+        const container = document.getElementById('question-container');
+        link.classList.add('disabled');
+        try {
+            const data = await postJson(link.dataset.apiUrl);
+            showFeedback('', '');
+            container.innerHTML = data.question_html;
+            if (data.stream_url) {
+                container.dataset.streamUrl = data.stream_url;
+                window.streamQuestion(container);
+            } else {
+                delete container.dataset.streamUrl;
+                window.activateQuestion(container);
+            }
+        } catch (error) {
+            showError(error.message);
+        } finally {
+            link.classList.remove('disabled');
+        }
+    }
+
+    return {submitAnswer, nextQuestion};
+})();
+
+window.QuizApi = QuizApi;
+
+// MCQ forms are handled here; drag_drop.js submits DAD answers itself.
+document.addEventListener('submit', (event) => {
+    const form = event.target;
+    if (!form.matches('.mcq-form') || !form.dataset.apiUrl) {
+        return;
+    }
+    event.preventDefault();
+    const selected = form.querySelector('input[name="answer"]:checked');
+    QuizApi.submitAnswer(form, {
+        question_id: form.querySelector('input[name="question_id"]').value,
+        answer: selected ? selected.value : '',
+    });
+});
+
+document.addEventListener('click', (event) => {
+    const link = event.target.closest('#next-question-link');
+    if (!link || !link.dataset.apiUrl || !document.getElementById('question-container')) {
+        return;
+    }
+    event.preventDefault();
+    if (!link.classList.contains('disabled')) {
+        QuizApi.nextQuestion(link);
+    }
+});
@@ -0,0 +1,82 @@
+// Streams a question that is still being generated into #question-container.
+// 'partial' events fill in the stem and options as the LLM completes them; the
+// 'final' event swaps in the validated question form, which is the only thing
+// that enables submitting. Exposed globally so quiz_api.js can start a stream
+// for a question fetched without a page load.
+
+// Initialises a question fragment that was inserted into the container after load.
+function activateQuestion(container) {
+    const dadScript = container.querySelector('script[src]');
+    if (!dadScript) {
+        return;
+    }
+    if (window.initDragDrop) {
+        window.initDragDrop();
+        return;
+    }
+    // Scripts inserted through innerHTML do not run, so load it explicitly.
+    const script = document.createElement('script');
+    script.src = dadScript.getAttribute('src');
+    document.body.appendChild(script);
+}
+
+function streamQuestion(container) {
+    const heading = container.querySelector('.stream-question-text');
+    const choices = container.querySelector('.stream-choices');
+    const status = container.querySelector('.stream-status');
+    const source = new EventSource(container.dataset.streamUrl);
+
+    function renderList(title, items) {
+        const section = document.createElement('div');
+        const label = document.createElement('h3');
+        label.textContent = title;
+        const list = document.createElement('ul');
+        items.forEach(item => {
+            const entry = document.createElement('li');
+            entry.textContent = item;
+            list.appendChild(entry);
+        });
+        section.appendChild(label);
+        section.appendChild(list);
+        choices.appendChild(section);
+    }
+
+    source.addEventListener('partial', (event) => {
+        const fields = JSON.parse(event.data);
+        if (fields.question_text) {
+            heading.textContent = fields.question_text;
+        }
+        if (fields.options) {
+            renderList('Options', fields.options);
+        }
+        if (fields.draggable_items) {
+            renderList('Draggable Items', fields.draggable_items);
+        }
+        if (fields.drop_targets) {
+            renderList('Drop Targets', fields.drop_targets);
+        }
+    });
+
+    source.addEventListener('final', (event) => {
+        source.close();
+        const data = JSON.parse(event.data);
+        delete container.dataset.streamUrl;
+        container.innerHTML = data.question_html;
+        activateQuestion(container);
+    });
+
+    source.addEventListener('error', () => {
+        source.close();
+        status.textContent = 'The question could not be loaded. Please try the next question.';
+    });
+}
+
+window.activateQuestion = activateQuestion;
+window.streamQuestion = streamQuestion;
+
+document.addEventListener('DOMContentLoaded', () => {
+    const container = document.getElementById('question-container');
+    if (container && container.dataset.streamUrl) {
+        streamQuestion(container);
+    }
+});